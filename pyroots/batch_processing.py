@@ -9,18 +9,588 @@ Batch processing functions:
 """
 
 import os
+import csv
+import shutil
+import importlib.machinery
+import importlib.util
+import queue
+import threading
+import traceback
 import numpy as np
 from numpy import array, uint8
 import pandas as pd
-from pyroots import *
-from skimage import io, color, filters, morphology, img_as_ubyte, img_as_float
-from multiprocessing import Pool
+from pyroots.preprocessing import preprocessing_filters, preprocessing_actions
+from pyroots.frangi_segmentation import frangi_segmentation
+from pyroots.thresholding_segmentation import thresholding_segmentation
+from pyroots.tennant_measurement import tennant_on_segmented, draw_fishnet
+from skimage import io
+from multiprocessing import Pool, Queue
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ThreadPoolExecutor
 from warnings import warn
+from functools import lru_cache
+from scipy import signal
 import cv2
 from time import strftime, sleep
 from tqdm import tqdm
 
 
+#################################################################################################
+#################################################################################################
+#########                                                                           #############
+#########                             Supporting Functions                          #############
+#########                                                                           #############
+#################################################################################################
+#################################################################################################
+
+def _iter_images(dir_in, extension_in, skip=(), sizes=None):
+    """
+    Recursively find files ending in `extension_in` in `dir_in` with `os.scandir`, which
+    reuses the file type from the directory listing rather than calling `stat()` per file.
+
+    Parameters
+    ----------
+    dir_in : str
+        Directory to the images or subdirectories containing the images.
+    extension_in : str
+        Extension of images to find.
+    skip : list of str
+        Directories containing any of these strings are not searched (ex. the output directory).
+    sizes : dict
+        If given, filled with `{os.path.join(path, filename): size in bytes}` for each file found.
+
+    Returns
+    -------
+    A generator of `(path, filename)` tuples.
+    """
+    skip = [i for i in skip if i]
+    if any(i in dir_in for i in skip):
+        return
+
+    subdirs = []
+    try:
+        entries = os.scandir(dir_in)
+    except OSError:  # unreadable directory; skipped, like os.walk
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):  # don't follow links, like os.walk
+                subdirs.append(entry.path)
+            elif entry.name.endswith(extension_in) and entry.is_file():
+                if sizes is not None:
+                    sizes[entry.path] = entry.stat().st_size
+                yield (dir_in, entry.name)
+
+    for i in subdirs:  # top-down, like os.walk
+        yield from _iter_images(i, extension_in, skip, sizes)
+
+
+def _load_params(params, names, default=None):
+    """
+    Load a parameters file (python syntax, any extension) into its own namespace.
+
+    Parameters
+    ----------
+    params : str
+        Path + filename for parameters file.
+    names : list of str
+        Names of the objects to pull from the parameters file.
+    default
+        Value for any of `names` that isn't defined in the parameters file.
+
+    Returns
+    -------
+    A dictionary of `{name: value}` for each of `names`.
+    """
+    if not os.path.exists(params):
+        raise ValueError("Couldn't find params file at {}".format(params))
+
+    loader = importlib.machinery.SourceFileLoader("pyroots_params", params)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    module.array = array  # params files are often written with numpy reprs
+    module.uint8 = uint8
+    try:
+        loader.exec_module(module)
+    except Exception:
+        raise ValueError("Couldn't load params file. Try checking it for words that need to be\n"
+                         "imported at the top of the file (ex. numpy functions).... Or edit source.")
+
+    return({i: getattr(module, i, default) for i in names})
+
+
+_REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2,
+                  4: cv2.IMREAD_REDUCED_COLOR_4,
+                  8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def _imread(path, reduce=1):
+    """
+    Load an image with `cv2.imread`, which calls libjpeg/libpng/libtiff directly, and return it
+    in RGB(A) band order like `skimage.io.imread`. Falls back to `skimage.io.imread` for
+    formats OpenCV can't read.
+
+    `reduce` of 2, 4, or 8 loads an 8-bit RGB image at that fraction of the size. For jpegs,
+    libjpeg scales while decoding, which is much faster than a full load.
+    """
+    if reduce == 1:
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    else:
+        img = cv2.imread(path, _REDUCED_FLAGS[reduce])
+
+    if img is None:
+        img = io.imread(path)
+        if reduce != 1:
+            img = cv2.resize(img, (img.shape[1] // reduce, img.shape[0] // reduce),
+                             interpolation=cv2.INTER_AREA)
+        return(img)
+
+    if img.ndim == 3:
+        if img.shape[2] == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        elif img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
+    return(img)
+
+
+def _imsave(path, img):
+    """
+    Save an RGB(A) or grayscale image with `cv2.imwrite`. Images OpenCV can't encode
+    as-is (ex. floats) are passed to `skimage.io.imsave` instead.
+    """
+    if img.dtype in (np.uint8, np.uint16):
+        if img.ndim == 3 and img.shape[2] == 3:
+            out = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        elif img.ndim == 3 and img.shape[2] == 4:
+            out = cv2.cvtColor(img, cv2.COLOR_RGBA2BGRA)
+        else:
+            out = img
+        try:
+            saved = cv2.imwrite(path, out)
+        except cv2.error:  # no encoder for the extension
+            saved = False
+        if saved:
+            return
+
+    io.imsave(path, img)
+
+
+_SETTINGS = {}  # loop settings and parameters, set in each worker by `_init_worker`
+
+def _init_worker(settings, cv2_threads=1):
+    """
+    `Pool` initializer. Stores the settings shared by every job once per worker instead of
+    sending them with each job, and keeps OpenCV from starting its own threads in each
+    of the pool's processes. `cv2_threads=None` leaves OpenCV alone (for serial runs).
+    """
+    global _SETTINGS
+    _SETTINGS = settings
+    if cv2_threads is not None:
+        cv2.setNumThreads(cv2_threads)
+
+
+def _log(message):
+    """
+    Report on a job from a worker. Messages from processes go through the log queue set by
+    `_map_jobs` to be printed by the main process; others go straight to `tqdm.write`. Either
+    way, workers don't contend for stdout, and messages print above the progress bar.
+    """
+    log = _SETTINGS.get('log')
+    if log is None:
+        tqdm.write(message)
+    else:
+        log.put(message)
+
+
+def _print_log(log):
+    """
+    Print messages from `log` with `tqdm.write` until it gets `None`. Runs in a thread of
+    the main process.
+    """
+    while True:
+        message = log.get()
+        if message is None:
+            return
+        tqdm.write(message)
+
+
+class _SharedArrays(object):
+    """
+    A dictionary of arrays held in shared memory. Pickles as the names of the memory blocks,
+    so each worker process attaches to the same data rather than receiving its own copy.
+    Use `get` to read an array (as a read-only view), and `unlink` in the creating process
+    once the workers are done.
+
+    Parameters
+    ----------
+    arrays : dict
+        ndarrays (or `None`) to share.
+    """
+    def __init__(self, arrays):
+        self._blocks = {}
+        self._specs = {}
+        for key, array in arrays.items():
+            if array is None:
+                self._specs[key] = None
+                continue
+            shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+            self._blocks[key] = shm
+            self._specs[key] = (shm.name, array.shape, array.dtype.str)
+        self._arrays = {}
+
+    def __getstate__(self):
+        return(self._specs)
+
+    def __setstate__(self, specs):
+        self._blocks = {}
+        self._specs = specs
+        self._arrays = {}
+
+    def get(self, key, default=None):
+        if key not in self._specs:
+            return(default)
+        if key not in self._arrays:  # attach on first use
+            spec = self._specs[key]
+            if spec is None:
+                self._arrays[key] = None
+            else:
+                name, shape, dtype = spec
+                if key not in self._blocks:
+                    self._blocks[key] = SharedMemory(name=name)
+                array = np.ndarray(shape, dtype=dtype, buffer=self._blocks[key].buf)
+                array.flags.writeable = False
+                self._arrays[key] = array
+        return(self._arrays[key])
+
+    def unlink(self):
+        self._arrays = {}
+        for shm in self._blocks.values():
+            shm.close()
+            shm.unlink()
+        self._blocks = {}
+
+
+def _map_jobs(core_fn, jobs, settings, threads, chunksize=1, backend='processes', stages=None,
+              on_result=None):
+    """
+    Run `core_fn` on each of `jobs` with a progress bar.
+
+    Parameters
+    ----------
+    core_fn : function
+        Module-level worker taking one job. Reads shared settings from `_SETTINGS`.
+    jobs : list
+        Inputs to `core_fn`.
+    settings : dict
+        Loop settings and parameters, passed to `_init_worker`.
+    threads : int or `None`
+        Number of workers. `None` runs in the main process.
+    chunksize : int
+        Jobs sent to a process at a time. Ignored for threads.
+    backend : str
+        `'processes'` runs `multiprocessing.Pool` workers, whose `_log` messages are printed
+        by a thread of this process. `'threads'` runs a
+        `ThreadPoolExecutor`, which avoids pickling images between processes; the heavy
+        numpy, scipy, and OpenCV calls release the GIL.
+    stages : tuple of functions
+        Optional `(load, process, save)` split of `core_fn`. With the `'threads'` backend,
+        these run as a pipeline (see `_run_pipeline`) so that reading, filtering, and
+        writing images overlap.
+    on_result : function
+        Called in this process on each output as it arrives, e.g. to write results to a
+        single file without the workers contending for it.
+
+    Returns
+    -------
+    A list of the outputs of `core_fn`, in order of completion for processes and pipelines.
+    """
+    out = []
+    if threads is None:
+        _init_worker(settings, cv2_threads=None)
+        out += _collect(map(core_fn, jobs), len(jobs), on_result)
+
+    elif backend == 'threads' and stages is not None:
+        _init_worker(settings, cv2_threads=None)
+        out += _collect(_run_pipeline(stages, jobs, threads), len(jobs), on_result)
+
+    elif backend == 'threads':
+        _init_worker(settings, cv2_threads=None)
+        with ThreadPoolExecutor(threads) as executor:
+            out += _collect(executor.map(core_fn, jobs), len(jobs), on_result)
+
+    elif backend == 'processes':
+        # workers send their messages here rather than printing them
+        log = Queue()
+        printer = threading.Thread(target=_print_log, args=(log,), daemon=True)
+        printer.start()
+        try:
+            with Pool(threads, initializer=_init_worker, initargs=(dict(settings, log=log),)) as thread_pool:
+                out += _collect(thread_pool.imap_unordered(core_fn,
+                                                           jobs,
+                                                           chunksize=chunksize),
+                                len(jobs), on_result)
+        finally:
+            log.put(None)
+            printer.join()
+
+    else:
+        raise ValueError("`backend` must be 'processes' or 'threads'")
+
+    return(out)
+
+
+def _collect(results, total, on_result=None):
+    """
+    Gather `results` into a list with a progress bar, passing each to `on_result` as it arrives.
+    """
+    out = []
+    for result in tqdm(results, total=total):
+        if on_result is not None:
+            on_result(result)
+        out.append(result)
+    return(out)
+
+
+_DONE = object()  # end-of-stream marker for pipeline queues
+
+
+class _PipelineError(object):
+    """
+    Carries an exception raised in a pipeline stage through to `_run_pipeline`.
+    """
+    def __init__(self, error):
+        self.error = error
+
+
+def _pipeline_stage(fn, q_in, q_out, workers):
+    """
+    Start `workers` threads applying `fn` to items from `q_in` and putting the results
+    on `q_out`. Puts `_DONE` on `q_out` once `q_in` is exhausted and all workers finish.
+    """
+    def _work():
+        while True:
+            item = q_in.get()
+            if item is _DONE:
+                q_in.put(_DONE)  # pass it on to the other workers of this stage
+                return
+            if not isinstance(item, _PipelineError):
+                try:
+                    item = fn(item)
+                except Exception as e:
+                    item = _PipelineError(e)
+            q_out.put(item)
+
+    def _run():
+        pool = [threading.Thread(target=_work, daemon=True) for i in range(workers)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        q_out.put(_DONE)
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
+def _run_pipeline(stages, jobs, threads):
+    """
+    Producer-consumer pipeline: `threads` threads decode images, `threads` threads process
+    them, and a single thread writes them, connected by bounded queues so that disk I/O
+    overlaps with computation without holding more than a few images in memory.
+
+    Parameters
+    ----------
+    stages : tuple of functions
+        `(load, process, save)`. Each takes the output of the previous one; `load` takes a job.
+        Stages should handle their own exceptions, and pass `None` along for skipped jobs.
+    jobs : list
+        Inputs to `load`.
+    threads : int
+        Number of decode threads and of processing threads.
+
+    Yields
+    ------
+    The outputs of `save`, in order of completion.
+    """
+    load_fn, process_fn, save_fn = stages
+    q_jobs, q_loaded, q_processed, q_out = [queue.Queue(maxsize=2*threads) for i in range(4)]
+
+    _pipeline_stage(load_fn, q_jobs, q_loaded, threads)
+    _pipeline_stage(process_fn, q_loaded, q_processed, threads)
+    _pipeline_stage(save_fn, q_processed, q_out, 1)
+
+    stop = threading.Event()
+
+    def _feed():
+        for job in jobs:
+            if stop.is_set():
+                break
+            q_jobs.put(job)
+        q_jobs.put(_DONE)
+
+    threading.Thread(target=_feed, daemon=True).start()
+
+    error = None
+    while True:
+        item = q_out.get()
+        if item is _DONE:
+            break
+        if isinstance(item, _PipelineError):
+            if error is None:  # stop feeding jobs, and let the ones in flight finish
+                error = item.error
+                stop.set()
+            continue
+        if error is None:
+            yield(item)
+
+    if error is not None:
+        raise error
+
+
+def _schedule(jobs, sizes, threads):
+    """
+    Order `jobs` largest file first, so that one big image isn't left running alone at the end,
+    and pick a chunksize that sends about 16MB of images to a worker at a time: large images go
+    one by one, small ones are batched to save on inter-process communication.
+
+    Parameters
+    ----------
+    jobs : list
+        Tuples starting with `(path, filename, ...)`.
+    sizes : dict
+        File sizes from `_iter_images`.
+    threads : int or `None`
+        Number of workers.
+
+    Returns
+    -------
+    A tuple of `(sorted jobs, chunksize)`.
+    """
+    def _size(job):
+        return(sizes.get(os.path.join(job[0], job[1]), 0))
+
+    jobs = sorted(jobs, key=_size, reverse=True)
+    if threads is None or len(jobs) == 0:
+        return((jobs, 1))
+
+    mean_mb = np.mean([_size(i) for i in jobs]) / 1e6
+    chunksize = max(1, min(64, int(16 / max(mean_mb, 0.1))))
+    chunksize = min(chunksize, max(1, len(jobs) // (threads*4)))  # but keep every worker busy
+    return((jobs, chunksize))
+
+
+@lru_cache(maxsize=8)
+def _gaussian_kernel(ksize, sigma):
+    """
+    1D gaussian kernel as `cv2.GaussianBlur` makes it, cached across directories.
+    """
+    return(cv2.getGaussianKernel(ksize, sigma)[:, 0])
+
+
+def _gaussian_blur(image, sigma):
+    """
+    `cv2.GaussianBlur(image, (0, 0), sigma)`, but by FFT convolution for large `sigma`. Direct
+    convolution costs grow with the kernel size, which is hundreds of pixels for the sigmas
+    used to smooth brightfield images; FFTs cost the same for any sigma. Results differ from
+    `cv2.GaussianBlur` only by rounding (a gray level or two for uint8).
+
+    Parameters
+    ----------
+    image : ndarray
+        2D or 3D (color) image.
+    sigma : float
+        Standard deviation of the gaussian kernel, in pixels.
+
+    Returns
+    -------
+    Blurred image, same shape and dtype as `image`.
+    """
+    if sigma <= 40:  # about where the FFT becomes faster
+        return(cv2.GaussianBlur(image, (0, 0), sigma))
+
+    # same kernel and border (reflect-101) as OpenCV
+    ksize = int(round(sigma*(3 if image.dtype == np.uint8 else 4)*2 + 1)) | 1
+    kernel = _gaussian_kernel(ksize, sigma)
+    r = ksize // 2
+    bands = ((0, 0),) * (image.ndim - 2)
+    out = np.pad(image.astype(np.float32), ((r, r), (r, r)) + bands, mode='reflect')
+
+    # separable: columns, then rows
+    out = signal.fftconvolve(out, kernel.reshape((-1,) + (1,)*(image.ndim - 1)), mode='valid', axes=0)
+    out = signal.fftconvolve(out, kernel.reshape((1, -1) + (1,)*(image.ndim - 2)), mode='valid', axes=1)
+
+    if np.issubdtype(image.dtype, np.integer):
+        info = np.iinfo(image.dtype)
+        out = np.clip(np.rint(out), info.min, info.max)
+    return(out.astype(image.dtype))
+
+
+def _split_done(filenames, extension_out, dirs):
+    """
+    Split `filenames` by whether an output file (same name, with `extension_out`) already exists
+    in any of `dirs`. Lists each directory once, rather than checking each file.
+
+    Returns
+    -------
+    A tuple of `(filenames to do, filenames done)`.
+    """
+    done = set()
+    for i in dirs:
+        try:
+            done.update(os.listdir(i))
+        except OSError:  # no directory, no outputs
+            pass
+
+    todo = []
+    finished = []
+    for f in filenames:
+        if os.path.splitext(f)[0] + extension_out in done:
+            finished.append(f)
+        else:
+            todo.append(f)
+    return((todo, finished))
+
+
+def _read_header(table, sep='\t'):
+    """
+    Read the column names from the first line of a delimited text file, without parsing the
+    rest of it.
+    """
+    with open(table) as file:
+        return(tuple(file.readline().rstrip('\r\n').split(sep)))
+
+
+def _table_writer(table, columns, sep='\t'):
+    """
+    Returns a function that appends rows to the open file `table` as `DataFrame.to_csv`
+    would: in the order of `columns`, with `\\n` line endings, and missing values left blank.
+    The function takes a DataFrame or a single row as a tuple, and ignores `None`.
+    """
+    writer = csv.writer(table, delimiter=sep, lineterminator='\n')
+
+    def write_rows(rows):
+        if rows is None:
+            return
+        if isinstance(rows, tuple):
+            rows = pd.DataFrame([rows], columns=columns)
+        rows = rows.reindex(columns=columns).astype(object)
+        rows = rows.where(rows.notna(), '')
+        writer.writerows(rows.itertuples(index=False, name=None))
+
+    return(write_rows)
+
+
+def _group_by_path(images):
+    """
+    Collect `(path, filename)` tuples from `_iter_images` into a dictionary of
+    `{path: [filenames]}`, in the order found.
+    """
+    out = {}
+    for path, filename in images:
+        out.setdefault(path, []).append(filename)
+    return(out)
+
+
 #################################################################################################
 #################################################################################################
 #########                                                                           #############
@@ -29,12 +599,107 @@ from tqdm import tqdm
 #################################################################################################
 #################################################################################################
 
+def _filter_load(job):
+    """
+    Load stage of `_filter_core_fn`. Returns `None` if the image needs no further work,
+    otherwise a dictionary of the image and where to write it.
+    """
+    path, filename, subpath = job
+    settings = _SETTINGS
+    dir_out = settings['dir_out']
+    path_in = os.path.join(path, filename)  # what's the image called and where is it?
+
+    # possible locations to write the output file
+    filename_out = os.path.splitext(filename)[0] + settings['extension_out']
+    path_out_PASS = os.path.join(dir_out, subpath, filename_out)
+    path_out_FAIL = os.path.join(dir_out, "DID NOT PASS", subpath, filename_out)
+
+    if settings['transfer_only']:  # nothing to test, so copy the file without decoding it
+        if dir_out is not None:
+            shutil.copyfile(path_in, path_out_PASS)
+        _log("PASSED: {}".format(os.path.join(subpath, filename)))
+        return(None)
+
+    loaded = True
+    try:
+        img = _imread(path_in, settings['test_scale'])  # load image, or a thumbnail to test
+    except:
+        _log("Couldn't load: {}. Continuing...".format(path_in))
+        filename_out = "MISLOAD" + filename_out
+        path_out_FAIL = os.path.join(dir_out, "DID NOT PASS", subpath, filename_out)
+        img = np.ones((30, 30, 3))  # make an image that cannot pass
+        loaded = False
+
+    return({'name': os.path.join(subpath, filename),
+            'path_in': path_in,
+            'path_out_PASS': path_out_PASS,
+            'path_out_FAIL': path_out_FAIL,
+            'img': img,
+            'loaded': loaded})
+
+
+def _filter_process(item):
+    """
+    Processing stage of `_filter_core_fn`. Adds the result of `preprocessing_filters`.
+    """
+    if item is None:
+        return(None)
+
+    settings = _SETTINGS
+    item['test'] = preprocessing_filters(item['img'],
+                                         settings['blur_params'],
+                                         settings['temperature_params'],
+                                         settings['low_contrast_params'],
+                                         settings['center'],
+                                         settings['test_scale'])
+    return(item)
+
+
+def _filter_save(item):
+    """
+    Save stage of `_filter_core_fn`. Writes the image to the PASS or FAIL directory.
+    """
+    if item is None:
+        return(True)
+
+    settings = _SETTINGS
+
+    # where to write the output file?
+    if item['test'] == True:
+        path_out = item['path_out_PASS']
+        _log("PASSED: {}".format(item['name']))
+
+    else:
+        path_out = item['path_out_FAIL']
+        _log("DID NOT PASS: {}".format(item['name']))
+
+    if settings['dir_out'] is not None:
+        if item['loaded'] and settings['same_format']:  # pixels are unchanged, so don't re-encode them
+            shutil.copyfile(item['path_in'], path_out)
+        elif item['loaded'] and settings['test_scale'] != 1:  # tested a thumbnail; save the full image
+            _imsave(path_out, _imread(item['path_in']))
+        else:
+            _imsave(path_out, item['img'])
+
+    return(True)  # for progress
+
+
+def _filter_core_fn(job):
+    """
+    Worker for `preprocessing_filter_loop`. Filters one image and saves it to the
+    PASS or FAIL directory. `job` is `(path, filename, subpath)`.
+    """
+    return(_filter_save(_filter_process(_filter_load(job))))
+
+
 def preprocessing_filter_loop(dir_in,
                               extension_in,
                               dir_out,
                               extension_out=".png",
                               params=None,
-                              threads=1):
+                              threads=1,
+                              backend='processes',
+                              test_scale=1):
     """
     Combines preprocessing filters (blur, color, contrast) into a loop. Convenient to run as a vehicle to transfer images
     from a portable drive to a permanent area.
@@ -51,9 +716,18 @@ def preprocessing_filter_loop(dir_in,
         Extension to save images.
     params : str
         Path + filename for parameters file for `pyroots.preprocessing_filters`. If `None` (default), only
-        loads and (possibly) resaves images. If not `None`, will only save images that pass test. See notes for format.
+        copies (or converts) images. If not `None`, will only save images that pass test. See notes for format.
     threads : int
         For multiprocessing
+    backend : str
+        `'processes'` (default) for `multiprocessing.Pool`, or `'threads'` to run in threads
+        of this process, which avoids copying images between processes. With `'threads'`,
+        images are read, processed, and written in a pipeline so disk and CPU work overlap.
+    test_scale : int
+        1 (default) tests images at full size. 2, 4, or 8 tests a thumbnail of that fraction of
+        the size instead, which is much faster to load and filter. Saved images are always full
+        size. The smoothing before the low contrast test is scaled to match, but `blur_params`
+        and `low_contrast_params` thresholds may still need adjusting for thumbnails.
 
     Returns
     -------
@@ -65,103 +739,60 @@ def preprocessing_filter_loop(dir_in,
     Except for `blur_band`, all are dictionaries with items named as arguments in respective functions. If not present,
     defaults to `None`. Will raise a `UserWarning` if the format and names are not correct (but not if `None`).
 
+    If `extension_in` and `extension_out` are the same, image files are copied byte-for-byte rather than
+    re-encoded. Otherwise they are converted to `extension_out`.
+
     """
 
+    if test_scale not in [1] + list(_REDUCED_FLAGS):
+        raise ValueError("`test_scale` must be 1, 2, 4, or 8")
+
     # Import parameters
-    try:
-        exec(open(params).read(), globals())
-    except:
-        if params is not None:
-            raise ValueError("Couldn't load params file. Try checking it for words like 'array' or\n'uint8' that need to be loaded with numpy and load these\n functions using `extra_imports`.... Or edit source.")
+    dicts = ['blur_params', 'temperature_params', 'low_contrast_params', 'center']
+    if params is None:
+        loaded = dict.fromkeys(dicts)
+    else:
+        loaded = _load_params(params, dicts)
+    if loaded['center'] is None:
+        loaded['center'] = True
 
-    # Count files to analyze for status bar
+    # Find files to analyze, once, for both the status bar and the loop
     print("Counting images to screen...")
-    total_files = 0
-    for path, folder, filename in os.walk(dir_in):
-        if dir_out not in path:
-            for f in filename:
-                if f.endswith(extension_in):
-                    total_files += 1
+    sizes = {}
+    images = list(_iter_images(dir_in, extension_in, skip=[dir_out], sizes=sizes))
+    total_files = len(images)
     print("\nYou have {} images to analyze".format(total_files))
 
-    for path, folder, filename in os.walk(dir_in):
-        if dir_out not in path:   # Don't run in the output directory.
-
-            # Make directory for saving objects
-            subpath = path[len(dir_in)+1:]
-
-            if not os.path.exists(os.path.join(dir_out, subpath)):
-                os.mkdir(os.path.join(dir_out, subpath))
-                os.mkdir(os.path.join(dir_out, "DID NOT PASS", subpath))
-
-            global _core_fn
-            def _core_fn(filename):
-                if filename.endswith(extension_in):
-                    path_in = os.path.join(path, filename)  # what's the image called and where is it?
-
-                    # possible locations to write the output file
-                    filename_out = os.path.splitext(filename)[0] + extension_out
-                    path_out_PASS = os.path.join(dir_out, subpath, filename_out)
-                    path_out_FAIL = os.path.join(dir_out, "DID NOT PASS", subpath, filename_out)
-
-                    # skip if already analyzed
-                    if os.path.exists(path_out_PASS) or os.path.exists(path_out_FAIL):
-                        print("SKIPPING: {}".format(os.path.join(subpath, filename)))
-
-                    else:  # analyze
-                        try:
-                            img = io.imread(path_in)  # load image
-                        except:
-                            print("Couldn't load: {}. Continuing...".format(path_in))
-                            filename_out = "MISLOAD" + filename_out
-                            path_out_FAIL = os.path.join(dir_out, "DID NOT PASS", subpath, filename_out)
-                            img = np.ones((30, 30, 3))  # make an image that cannot pass
-                            pass
-
-                        test = preprocessing_filters(img,
-                                                     blur_params,
-                                                     temperature_params,
-                                                     low_contrast_params,
-                                                     center)
-
-                        # where to write the output file?
-                        if test == True:
-                            if dir_out is not None:
-                                io.imsave(path_out_PASS, img)
-                            print("PASSED: {}".format(os.path.join(subpath, filename)))
-
-                        else:
-                            if dir_out is not None:
-                                io.imsave(path_out_FAIL, img)
-                            print("DID NOT PASS: {}".format(os.path.join(subpath, filename)))
-
-                    return(True)  # for progress
-
-            # Init threads within each path
-            out = []  # for counting
-            if threads is None:
-                out += tqdm(map(_core_fn, filename),
-                            total=total_files)
-            else:
-                sleep(2)  # to give everything time to  load
-                chunks = min(5, int(total_files/2*threads) + 1)
-                thread_pool = Pool(threads)
-                # Work on _core_fn (and give progressbar)
-                out += tqdm(thread_pool.imap_unordered(_core_fn,
-                                                       filename,
-                                                       chunksize=chunks),
-                            total=total_files)
-                # finish
-                thread_pool.close()
-                thread_pool.join()
-#            thread_pool = Pool(threads)
-#            # Work on _core_fn
-#            thread_pool.map(_core_fn, filename)
-#            # finish
-#            thread_pool.close()
-#            thread_pool.join()
-
-    del globals()[_core_fn]  # to keep things safe
+    # Everything the workers need besides the image itself
+    same_format = extension_in.lower() == extension_out.lower()
+    settings = dict(loaded,
+                    dir_out=dir_out,
+                    extension_out=extension_out,
+                    same_format=same_format,
+                    transfer_only=same_format and params is None,
+                    test_scale=test_scale)
+
+    # Make directories for saving objects, and list the jobs
+    jobs = []
+    for path, filenames in _group_by_path(images).items():
+        subpath = path[len(dir_in)+1:]
+        os.makedirs(os.path.join(dir_out, subpath), exist_ok=True)
+        os.makedirs(os.path.join(dir_out, "DID NOT PASS", subpath), exist_ok=True)
+
+        # skip if already analyzed
+        filenames, done = _split_done(filenames, extension_out,
+                                      [os.path.join(dir_out, subpath),
+                                       os.path.join(dir_out, "DID NOT PASS", subpath)])
+        for f in done:
+            print("SKIPPING: {}".format(os.path.join(subpath, f)))
+
+        jobs += [(path, f, subpath) for f in filenames]
+
+    # Init threads once for the whole tree
+    jobs, chunks = _schedule(jobs, sizes, threads)
+    out = _map_jobs(_filter_core_fn, jobs, settings, threads, chunks, backend,
+                    stages=(_filter_load, _filter_process, _filter_save))  # for counting
+
     return("Done")
 
 #################################################################################################
@@ -172,12 +803,91 @@ def preprocessing_filter_loop(dir_in,
 #################################################################################################
 #################################################################################################
 
+def _actions_load(job):
+    """
+    Load stage of `_actions_core_fn`. Returns `None` if the image could not be loaded,
+    otherwise a dictionary of the image and where to write it.
+    """
+    path, filename, subpath = job
+    settings = _SETTINGS
+    dir_out = settings['dir_out']
+    path_in = os.path.join(path, filename)  # what's the image called and where is it?
+
+    # possible locations to write the output file
+    filename_out = os.path.splitext(filename)[0] + settings['extension_out']
+    path_out_PASS = os.path.join(dir_out, subpath, filename_out)
+    path_out_FAIL = os.path.join(dir_out, "FAILED PROCESSES", subpath, filename_out)
+
+    try:
+        img = _imread(path_in)  # load image
+    except:
+        _log("Couldn't load: {}. Continuing...".format(path_in))
+        return(None)
+
+    return({'name': os.path.join(subpath, filename),
+            'path_out_PASS': path_out_PASS,
+            'path_out_FAIL': path_out_FAIL,
+            'correction': settings['corrections'].get(subpath),
+            'img': img})
+
+
+def _actions_process(item):
+    """
+    Processing stage of `_actions_core_fn`. Runs `preprocessing_actions` on the image.
+    """
+    if item is None:
+        return(None)
+
+    settings = _SETTINGS
+    item['img'], item['warnings'] = preprocessing_actions(item['img'],
+                                                          item['correction'],
+                                                          settings['brightfield_correction_params'],
+                                                          settings['registration_params'],
+                                                          settings['smoothing_params'],
+                                                          count_warnings=True)
+    return(item)
+
+
+def _actions_save(item):
+    """
+    Save stage of `_actions_core_fn`. Writes the image to the output or FAILED PROCESSES
+    directory.
+    """
+    if item is None:
+        return(True)
+
+    dir_out = _SETTINGS['dir_out']
+
+    # where to write the output file?
+    if item['warnings'] == 0:  # save the manipulated image
+        if dir_out is not None:
+            _imsave(item['path_out_PASS'], item['img'])
+        #print("PASSED: {}".format(item['name']))
+
+    else:
+        if dir_out is not None:  # save a copy of the preprocessed image
+            _imsave(item['path_out_FAIL'], item['img'])
+        _log("Something Failed: {}".format(item['name']))
+
+    return(True)  # for tqdm compatibility
+
+
+def _actions_core_fn(job):
+    """
+    Worker for `preprocessing_actions_loop`. Runs `preprocessing_actions` on one image and
+    saves it. `job` is `(path, filename, subpath)`; the brightfield correction image for
+    `subpath` is in `_SETTINGS['corrections']`.
+    """
+    return(_actions_save(_actions_process(_actions_load(job))))
+
+
 def preprocessing_actions_loop(dir_in,
                                extension_in,
                                dir_out,
                                extension_out=".png",
                                params=None,
-                               threads=1):
+                               threads=1,
+                               backend='processes'):
     """
     Combines preprocessing filters (blur, color, contrast) into a loop. Convenient to run as a vehicle to transfer images
     from a portable drive to a permanent area.
@@ -197,6 +907,10 @@ def preprocessing_actions_loop(dir_in,
         loads and (possibly) resaves images. If not `None`, will only save images that pass test. See notes for format.
     threads : int
         For multiprocessing
+    backend : str
+        `'processes'` (default) for `multiprocessing.Pool`, or `'threads'` to run in threads
+        of this process, which avoids copying images between processes. With `'threads'`,
+        images are read, processed, and written in a pipeline so disk and CPU work overlap.
 
     Returns
     -------
@@ -211,130 +925,87 @@ def preprocessing_actions_loop(dir_in,
 
     """
 
-
-    try:
-        exec(open(params).read(), globals())
-    except:
-        if params is not None:
-            raise ValueError("Couldn't load params file")
-            return  # can't do anything without the parameters!
-
     # make sure all dictionaries have something assigned to them, including None
     dicts = ['make_brightfield_params',
              'brightfield_correction_params',
              'smoothing_params',
              'registration_params']
-    print("The parameters you've loaded are:\n")
+    if params is None:
+        loaded = dict.fromkeys(dicts, 'skip')
+    else:
+        loaded = _load_params(params, dicts, default='skip')
 
+    print("The parameters you've loaded are:\n")
     for i in dicts:
-        try:
-            print(i + " = " + str(globals()[i]))
-        except:
-            print(i + " = " + str('skip'))
-            globals()[i] = 'skip'
+        print(i + " = " + str(loaded[i]))
 
-    # Count files to analyze for status bar
+    make_brightfield_params = loaded.pop('make_brightfield_params')
+    if make_brightfield_params == 'skip':
+        make_brightfield_params = None
+
+    # Find files to analyze, once, for both the status bar and the loop
     print("Counting {} images to screen in {}".format(extension_in, dir_in))
-    total_files = 0
-    for path, folder, filename in os.walk(dir_in):
-        if dir_out not in path:
-            for f in filename:
-                if f.endswith(extension_in):
-                    total_files += 1
+    sizes = {}
+    images = list(_iter_images(dir_in, extension_in, skip=[dir_out, "FAILED PROCESSES"], sizes=sizes))
+    total_files = len(images)
     print("\nYou have {} images to analyze".format(total_files))
 
-    # initiate loop
-    for path, folder, filename in os.walk(dir_in):
-        if dir_out not in path and "FAILED PROCESSES" not in path:   # Don't run in the output directory.
-            # ID the current folder
-            subpath = path[len(dir_in)+1:]
-
-            # Make directories for saving images
-            if dir_out is not None:
-                if not os.path.exists(os.path.join(dir_out, subpath)):
-                    os.mkdir(os.path.join(dir_out, subpath))
-                if not os.path.exists(os.path.join(dir_out, "FAILED PROCESSES", subpath)):
-                    os.mkdir(os.path.join(dir_out, "FAILED PROCESSES", subpath))
-
-            # make a brightfield correction image for the directory
-            def _make_brightfield_image(directory, brightfield_name, brightfield_sigma):
-                correction = io.imread(os.path.join(directory, brightfield_name))
-                correction = cv2.GaussianBlur(correction, (0, 0), brightfield_sigma)
-                return(correction)
-
-            try:
-                correction = _make_brightfield_image(path, **make_brightfield_params)
-            except:
-                if make_brightfield_params is not None:
-                    print("\nCould not make correction image. Does\n{}\nexist?\nContinuing to next folder...\n".format(\
-                        os.path.join(subpath, make_brightfield_params['brightfield_name'])))
-                    continue  # can't do this folder, so move on to the next
-                else:
-                    correction = None
-                    pass
-
-            global _core_fn  # bad form for compatibility with Pool.map()
-            def _core_fn(filename):
-                if filename.endswith(extension_in):
-                    path_in = os.path.join(path, filename)  # what's the image called and where is it?
-
-                    # possible locations to write the output file
-                    filename_out = os.path.splitext(filename)[0] + extension_out
-                    path_out_PASS = os.path.join(dir_out, subpath, filename_out)
-                    path_out_FAIL = os.path.join(dir_out, "FAILED PROCESSES", subpath, filename_out)
-
-                    # skip if already analyzed
-                    if os.path.exists(path_out_PASS) or os.path.exists(path_out_FAIL):
-                        print("Already Analyzed: {}".format(os.path.join(subpath, filename)))
-
-                    else:  # analyze
-                        try:
-                            img = io.imread(path_in)  # load image
-                        except:
-                            print("Couldn't load: {}. Continuing...".format(path_in))
-                            return
-
-                        img_out, warnings = preprocessing_actions(img,
-                                                                  correction,
-                                                                  brightfield_correction_params,
-                                                                  registration_params,
-                                                                  smoothing_params,
-                                                                  count_warnings=True)
-
-                        # where to write the output file?
-                        if warnings == 0:  # save the manipulated image
-                            if dir_out is not None:
-                                io.imsave(path_out_PASS, img_out)
-                            #print("PASSED: {}".format(os.path.join(subpath, filename)))
-
-                        else:
-                            if dir_out is not None:  # save a copy of the preprocessed image
-                                io.imsave(path_out_FAIL, img_out)
-                            print("Something Failed: {}".format(os.path.join(subpath, filename)))
-
-                    return(True)  # for tqdm compatibility
-
-            # Init threads within each path
-            out = []  # for counting with tqdm
-            if threads is None:
-                sleep(2)  # let everything print out nicely
-                out += tqdm(map(_core_fn, filename),
-                            total=total_files)
+    # Everything the workers need besides the image and its correction
+    settings = dict(loaded, dir_out=dir_out, extension_out=extension_out)
+
+    # make a brightfield correction image for the directory
+    def _make_brightfield_image(directory, brightfield_name, brightfield_sigma):
+        correction = _imread(os.path.join(directory, brightfield_name))
+        correction = _gaussian_blur(correction, brightfield_sigma)
+        return(correction)
+
+    # Prepare each folder and list the jobs
+    jobs = []
+    corrections = {}  # by subpath, shipped to workers once rather than with each job
+    for path, filenames in _group_by_path(images).items():
+        # ID the current folder
+        subpath = path[len(dir_in)+1:]
+
+        try:
+            correction = _make_brightfield_image(path, **make_brightfield_params)
+        except:
+            if make_brightfield_params is not None:
+                print("\nCould not make correction image. Does\n{}\nexist?\nContinuing to next folder...\n".format(\
+                    os.path.join(subpath, make_brightfield_params['brightfield_name'])))
+                continue  # can't do this folder, so move on to the next
             else:
-                sleep(2)  # to give everything time to  load
-                #chunks = min(5, int(total_files/2*threads) + 1)
-                chunks=1
-                thread_pool = Pool(threads)
-                # Work on _core_fn (and give progressbar)
-                out += tqdm(thread_pool.imap_unordered(_core_fn,
-                                                       filename,
-                                                       chunksize=chunks),
-                            total=total_files)
-                # finish
-                thread_pool.close()
-                thread_pool.join()
-
-#    del globals()[_core_fn]  # to keep things safe
+                correction = None
+                pass
+
+        # Make directories for saving images
+        if dir_out is not None:
+            os.makedirs(os.path.join(dir_out, subpath), exist_ok=True)
+            os.makedirs(os.path.join(dir_out, "FAILED PROCESSES", subpath), exist_ok=True)
+
+            # skip if already analyzed
+            filenames, done = _split_done(filenames, extension_out,
+                                          [os.path.join(dir_out, subpath),
+                                           os.path.join(dir_out, "FAILED PROCESSES", subpath)])
+            for f in done:
+                print("Already Analyzed: {}".format(os.path.join(subpath, f)))
+
+        corrections[subpath] = correction
+        jobs += [(path, f, subpath) for f in filenames]
+
+    # Processes share one copy of the correction images; threads can use them as they are
+    if threads is not None and backend == 'processes':
+        corrections = _SharedArrays(corrections)
+    settings['corrections'] = corrections
+
+    # Init threads once for the whole tree
+    sleep(2)  # let everything print out nicely
+    jobs, chunks = _schedule(jobs, sizes, threads)
+    try:
+        out = _map_jobs(_actions_core_fn, jobs, settings, threads, chunks, backend,
+                        stages=(_actions_load, _actions_process, _actions_save))  # for counting with tqdm
+    finally:
+        if isinstance(corrections, _SharedArrays):
+            corrections.unlink()
 
     return("Done with preprocessing. You can view the results in {}".format(dir_out))
 
@@ -346,6 +1017,70 @@ def preprocessing_actions_loop(dir_in,
 ##################################################################################################################################################################################
 
 
+def _frangi_core_fn(job):
+    """
+    Worker for `frangi_image_loop`. Segments one image, returns its geometry for the table and
+    (optionally) saves an image of the objects. `job` is `(path, filename, subpath)`.
+    """
+    path, filename, subpath = job
+    s = _SETTINGS
+    path_in = os.path.join(path, filename)
+    subpath_in = os.path.join(subpath, filename) # for printing purposes
+    # Where to write the output image?
+    filename_out = os.path.splitext(filename)[0] + ".png"
+    path_out = os.path.join(s['dir_out'], subpath, filename_out)
+
+    if s['params'] is None:  # just list the images that *would* be analyzed
+        _log(subpath_in)
+        return(None)
+
+    else: #(try to) do it
+        try:
+            img = _imread(path_in)  # load image
+            if s['mask'] is None:
+                pass
+            elif s['mask'].ndim == 2:  # zero outside the mask in one pass, in OpenCV
+                img = cv2.bitwise_and(img, img, mask=s['mask'])
+            else:
+                np.multiply(img, s['mask'], out=img, casting='unsafe')
+
+            if len(img.shape) != 3:
+                _log("\n{} is not a color image! Skipping...\n".format(subpath_in))
+
+            objects_dict = frangi_segmentation(img, s['colors'],              #### Insert your custom function here ####
+                                               s['frangi_args'],
+                                               s['threshold_args'],
+                                               s['color_args_1'],
+                                               s['color_args_2'],
+                                               s['color_args_3'],
+                                               s['morphology_args_1'],
+                                               s['morphology_args_2'],
+                                               s['hollow_args'],
+                                               s['fill_gaps_args'],
+                                               s['diameter_args'],
+                                               s['diameter_bins'],
+                                               image_name=os.path.join(subpath,
+                                                                       filename))
+
+            #save images?
+            if s['save_images'] is True:
+                # straight to 0/255 uint8, without a uint8 copy and an int64 product in between
+                _imsave(path_out, np.where(objects_dict['objects'], np.uint8(255), np.uint8(0)))
+
+            #Update on progress
+            _log("Done: {}".format(subpath_in))
+
+            df_out = objects_dict['geometry']
+            df_out["Time"] = strftime("%Y-%m-%d %H:%M:%S")  # appended; columns are ordered once, at the end
+
+        except:
+            df_out = None
+            _log("\nCouldn't Process: {}.\n     ...Continuing...".format(subpath_in))
+
+
+        return(df_out)
+
+
 def frangi_image_loop(dir_in,
                       extension_in,
                       dir_out=None,
@@ -354,7 +1089,8 @@ def frangi_image_loop(dir_in,
                       params=None,
                       mask=None,
                       save_images=False,
-                      threads=1):
+                      threads=1,
+                      backend='processes'):
     """
     Reference function to loop through images in a directory. As it is written, it returns
     a dataframe from `pyroots.frangi_segmentation` and also writes images showing the objects analyzed.
@@ -378,10 +1114,14 @@ def frangi_image_loop(dir_in,
         print a list of subpaths + images that would be processed, with a warning.
     mask : ndarray
         Binary array of the same dimensions as each image, with 1 being the part of the image to analyze.
+        May be 2D (one band for all colors) or 3D (per color band).
     save_images : bool
         Do you want to save images of the objects?
     threads : int
         For multiprocessing
+    backend : str
+        `'processes'` (default) for `multiprocessing.Pool`, or `'threads'` to run in threads
+        of this process, which avoids copying images between processes.
     extra_imports : list
         If raises error importing params, then write a list of lists as
             [[lib1, fun1, fun2, ...],
@@ -395,30 +1135,17 @@ def frangi_image_loop(dir_in,
 
     if params is None:
         print("No parameters defined. Printing paths to images.\n")
+        loaded = dict.fromkeys(dicts)
 
     else:
-        try:  # loading the params.
-            exec(open(params).read(), globals())
-
-            print("The parameters you've loaded are:\n")
+        # loading the params. If not present in `params` file, must define as None to work
+        loaded = _load_params(params, dicts, default=None)
 
-            for i in dicts:  # report the parameters
-                try:         # if present in `params` file
-                    print("{} = {}".format(i, str(globals()[i])))
-                    print("\n")
+        print("The parameters you've loaded are:\n")
 
-                except:      # if not present in `params` file, must define as None to work
-                    globals()[i] = None  # assign as none
-                    print("{} = {}".format(i, str(globals()[i])))
-                    print("\n")
-
-        except:
-            if os.path.exists(params):
-                raise ValueError("Couldn't load params file. Try checking it for words like 'array' or\
-                \n'uint8' that need to be loaded with numpy and load these functions\
-                \n at the top of your script.... Or edit source.")
-            else:
-                raise ValueError("Couldn't find params file at {}".format(params))
+        for i in dicts:  # report the parameters
+            print("{} = {}".format(i, str(loaded[i])))
+            print("\n")
 
     ### Make and initiate table_out
     # define where to save the table
@@ -426,10 +1153,7 @@ def frangi_image_loop(dir_in,
         table_out = os.path.join(dir_in, "Pyroots Results.txt")
 
     # make the directory, if it doesn't exist
-    try:
-        os.mkdir(os.path.split(table_out)[0])
-    except:
-        pass
+    os.makedirs(os.path.dirname(table_out) or '.', exist_ok=True)
 
     # should the table be overwritten? If not, append.
     if os.path.exists(table_out):
@@ -445,7 +1169,7 @@ def frangi_image_loop(dir_in,
 
 
     # initiate the new table
-    if diameter_bins is None:
+    if loaded['diameter_bins'] is None or loaded['diameter_bins'] == 'skip':
         df_out = pd.DataFrame(columns=("Time", "ImageName", "Length", "NObjects", "MeanDiam"))  # for concatenating purposes
         ncol = 5
     else:
@@ -456,10 +1180,10 @@ def frangi_image_loop(dir_in,
         df_out.to_csv(table_out, sep='\t', index=False, mode='w')
 
     else:  # make sure it's compatible
-        temp = pd.read_table(table_out, sep='\t', nrows=1).columns.values
+        temp = _read_header(table_out)
         if len(temp) != ncol:  # same number of columns
             raise ValueError("Cannot Append to Existing Data Table. Different number of columns. Try a new name!")
-        elif sum(temp != df_out.columns.values) > 0:  # same column names
+        elif temp != tuple(df_out.columns):  # same column names
             raise ValueError("Cannot Append to Existing Data Table. Different number of columns. Try a new name!")
 
 
@@ -470,109 +1194,54 @@ def frangi_image_loop(dir_in,
     if save_images is True:
         if params is not None:
             print("\nSaving images to {}".format(dir_out))
-        if not os.path.exists(dir_out):
-            os.mkdir(dir_out)
-
-    #Count files to analyze
-    total_files = 0
-    for path, folder, filename in os.walk(dir_in):
-        if dir_out not in path:
-            for f in filename:
-                if f.endswith(extension_in):
-                    total_files += 1
+        os.makedirs(dir_out, exist_ok=True)
+
+    #Find files to analyze
+    sizes = {}
+    images = list(_iter_images(dir_in, extension_in, skip=[dir_out], sizes=sizes))
+    total_files = len(images)
     print("\nYou have {} images to analyze".format(total_files))
 
-    #Begin looping
-    out = []  # secondary saving method
-    for path, folder, filename in os.walk(dir_in):
-        if dir_out not in path:   # Don't run in the output directory.
-
-            # Make directory for saving objects
-            subpath = path[len(dir_in)+1:]
-            if not os.path.exists(os.path.join(dir_out, subpath)):
-                os.mkdir(os.path.join(dir_out, subpath))
-
-            # What we'll do:
-            global _core_fn  # bad form for Pool.map() compatibility
-            def _core_fn(filename):
-                if filename.endswith(extension_in):
-                    # count progress.
-
-                    path_in = os.path.join(path, filename)
-                    subpath_in = os.path.join(subpath, filename) # for printing purposes
-                    # Where to write the output image?
-                    filename_out = os.path.splitext(filename)[0] + ".png"
-                    path_out = os.path.join(dir_out, subpath, filename_out)
-
-                    if os.path.exists(path_out): #skip
-                        print("\nALREADY ANALYZED: {}. Skipping...\n".format(subpath_in))
-
-                    else: #(try to) do it
-                        try:
-                            img = io.imread(path_in)  # load image
-                            if mask is not None:
-                                img = img * mask
-
-                            if len(img.shape) != 3:
-                                print("\n{} is not a color image! Skipping...\n".format(subpath_in))
-
-                            objects_dict = frangi_segmentation(img, colors,              #### Insert your custom function here ####
-                                                               frangi_args,
-                                                               threshold_args,
-                                                               color_args_1,
-                                                               color_args_2,
-                                                               color_args_3,
-                                                               morphology_args_1,
-                                                               morphology_args_2,
-                                                               hollow_args,
-                                                               fill_gaps_args,
-                                                               diameter_args,
-                                                               diameter_bins,
-                                                               image_name=os.path.join(subpath,
-                                                                                       filename))
-
-                            #save images?
-                            if save_images is True:
-                                io.imsave(path_out, 255*objects_dict['objects'].astype('uint8'))
-
-                            #Update on progress
-                            print("Done: {}".format(subpath_in))
-
-                            df_out = objects_dict['geometry']
-                            df_out.insert(0, "Time", strftime("%Y-%M-%d %H:%M:%S"))
-
-                            df_out.to_csv(table_out, sep='\t', index=False, header=False, mode='a')
-
-                        except:
-                            df_out = None
-                            if params is None:  # just list the images that *would* be analyzed
-                                print(subpath_in)
-                            else:
-                                print("\nCouldn't Process: {}.\n     ...Continuing...".format(subpath_in))
-
-
-                        return(df_out)
-
-            # Init threads within each path
-            if threads is None:
-                out += tqdm(map(_core_fn, filename),
-                            total=total_files)
-            else:
-                sleep(1)  # to give everything time to  load
-                chunks = min(5, int(total_files/2*threads) + 1)
-                thread_pool = Pool(threads)
-                # Work on _core_fn (and give progressbar)
-                out += tqdm(thread_pool.imap_unordered(_core_fn,
-                                                       filename,
-                                                       chunksize=chunks),
-                            total=total_files)
-                # finish
-                thread_pool.close()
-                thread_pool.join()
-
-
-    out = pd.concat([i for i in out])
-    del globals()[_core_fn]  # to keep things safe
+    # A single-band mask is applied with `cv2.bitwise_and`, which takes it as uint8
+    if mask is not None:
+        mask = np.asarray(mask)
+        if mask.ndim == 2:
+            mask = (mask != 0).astype(np.uint8)
+
+    # Everything the workers need besides the image itself
+    settings = dict(loaded,
+                    dir_out=dir_out,
+                    table_out=table_out,
+                    params=params,
+                    mask=mask,
+                    save_images=save_images)
+
+    # Make directories for saving objects, and list the jobs
+    jobs = []
+    for path, filenames in _group_by_path(images).items():
+        subpath = path[len(dir_in)+1:]
+        os.makedirs(os.path.join(dir_out, subpath), exist_ok=True)
+
+        # skip if already analyzed
+        filenames, done = _split_done(filenames, ".png", [os.path.join(dir_out, subpath)])
+        for f in done:
+            print("\nALREADY ANALYZED: {}. Skipping...\n".format(os.path.join(subpath, f)))
+
+        jobs += [(path, f, subpath) for f in filenames]
+
+    #Begin looping, with threads initiated once for the whole tree
+    jobs, chunks = _schedule(jobs, sizes, threads)
+    # The table is written here, as results arrive, so workers never append to it at once
+    with open(table_out, 'a', newline='') as table:
+        out = _map_jobs(_frangi_core_fn, jobs, settings, threads, chunks, backend,
+                        on_result=_table_writer(table, df_out.columns))  # secondary saving method
+
+
+    # skipped and failed images return None
+    out = [i for i in out if i is not None]
+    if len(out) == 0:
+        return(df_out)  # empty, with the table's columns
+    out = pd.concat(out, ignore_index=True, sort=False).reindex(columns=df_out.columns)
     return(out)
 
 ############################################################################################################################################################################
@@ -581,6 +1250,80 @@ def frangi_image_loop(dir_in,
 ####################                                                                                                                         ###############################
 ############################################################################################################################################################################
 
+def _batch_core_fn(job):
+    """
+    Worker for `pyroots_batch_loop`. Segments one image, returns its geometry for the table and
+    (optionally) saves an image of the objects. `job` is `(path, filename, subpath)`.
+    """
+    path, filename, subpath = job
+    s = _SETTINGS
+    segmentation_args = s['segmentation_args']
+    path_in = os.path.join(path, filename)
+    subpath_in = os.path.join(subpath, filename) # for printing purposes
+    # Where to write the output image?
+    filename_out = os.path.splitext(filename)[0] + s['extension_out']
+    path_out = os.path.join(s['dir_out'], subpath, filename_out)
+
+    if os.path.exists(path_out): #skip
+        _log("\nALREADY ANALYZED: {}. Skipping...\n".format(subpath_in))
+        return(None)
+
+    elif s['params'] is None:  # just list the images that *would* be analyzed
+        _log(subpath_in)
+        return(None)
+
+    try: #(try to) do it
+        img = _imread(path_in)  # load image
+        image_name=os.path.join(subpath, filename)
+
+        if s['expect_color'] and img.ndim != 3:  # segmentation would fail anyway
+            _log("\n{} is not a color image! Skipping...\n".format(subpath_in))
+            return(None)
+
+        if s['method'] == 'frangi':
+            objects_dict = frangi_segmentation(
+                img,
+                image_name=image_name,
+                verbose=False,
+                **segmentation_args
+            )
+
+        elif s['method'] == 'thresholding':
+            objects_dict = thresholding_segmentation(
+                img,
+                image_name=image_name,
+                verbose=False,
+                **segmentation_args
+            )
+
+        elif s['method'] == 'custom':
+            raise ValueError(
+            """No custom function defined. Define it in pyroots/batch_processing.py and 
+            restart your python session (and comment out this error message)""")
+
+        else:
+            raise ValueError(
+            """Didn't understand what method you wanted. Options are 'frangi', 
+            'thresholding', and 'custom'""")
+
+
+        #save images?
+        if s['save_images'] is True:  # black/white for printing
+            _imsave(path_out, np.where(objects_dict['objects'], np.uint8(255), np.uint8(0)))
+
+        #Update on progress
+        #_log("Done: {}".format(subpath_in))
+
+        df_out = objects_dict['geometry']
+        df_out["Time"] = strftime("%Y-%m-%d_%H:%M:%S")  # appended; columns are ordered once, at the end
+
+    except (OSError, ValueError, RuntimeError):  # anything else is a bug, and should stop the loop
+        df_out = None
+        _log("\nCouldn't Process: {}.\n{}     ...Continuing...".format(subpath_in, traceback.format_exc()))
+
+    return(df_out)
+
+
 def pyroots_batch_loop(dir_in,
                        extension_in,
                        method,
@@ -620,11 +1363,6 @@ def pyroots_batch_loop(dir_in,
         Do you want to save images of the objects?
     threads : int
         For multiprocessing
-    extra_imports : list
-        If raises error importing params, then write a list of lists as
-            [[lib1, fun1, fun2, ...],
-             [lib2, fun1, fun2, ...],
-             [...]].
     """
     ### make sure all dictionaries have something assigned to them, including None
     method = method.lower()
@@ -664,35 +1402,25 @@ def pyroots_batch_loop(dir_in,
 
     elif method == 'custom':
         warn('make a list of parameter/dictionary names in the source!')
+        dicts = []
     else:
         raise ValueError("Invalid method. 'thresholding', 'frangi', and 'custom' are the options")
 
 
     if params is None:
         print("No parameters defined. Printing paths to images.\n")
+        loaded = dict.fromkeys(dicts, 'skip')
 
     else:
-        try:  # loading the params.
-            exec(open(params).read(), globals())
+        # loading the params. If not present in `params` file, must define as 'skip' to work
+        loaded = _load_params(params, dicts, default='skip')
 
-            print("The parameters you've loaded are:\n")
+        print("The parameters you've loaded are:\n")
 
-            for i in dicts:  # report the parameters
-                try:         # if present in `params` file
-                    print("{} = {}".format(i, str(globals()[i])))
+        for i in dicts:  # report the parameters
+            print("{} = {}".format(i, str(loaded[i])))
 
-                except:      # if not present in `params` file, must define as 'skip' to work
-                    globals()[i] = 'skip'  # assign as 'skip'
-                    print("{} = {}".format(i, str(globals()[i])))
-
-        except:
-            if os.path.exists(params):
-                raise ValueError(
-                """Couldn't load params file. Try checking it for words like 'array' or 
-                'uint8' that need to be loaded with numpy and add a line to load these 
-                functions/modules at the top of your script.... Or edit source.""")
-            else:
-                raise ValueError("Couldn't find params file at {}".format(params))
+    diameter_bins = loaded.get('diameter_bins')
 
     ### Make and initiate table_out
     # define where to save the table
@@ -700,10 +1428,7 @@ def pyroots_batch_loop(dir_in,
         table_out = os.path.join(dir_in, "Pyroots Results.txt")
 
     # make the directory, if it doesn't exist
-    try:
-        os.mkdir(os.path.split(table_out)[0])
-    except:
-        pass
+    os.makedirs(os.path.dirname(table_out) or '.', exist_ok=True)
 
     # should the table be overwritten? If not, append.
     if os.path.exists(table_out):
@@ -719,7 +1444,7 @@ def pyroots_batch_loop(dir_in,
 
 
     # initiate the new table
-    if diameter_bins is None or diameter_bins is 'skip':
+    if diameter_bins is None or diameter_bins == 'skip':
         df_out = pd.DataFrame(columns=("Time", "ImageName", "Length", "NObjects", "MeanDiam"))  # for concatenating purposes
         ncol = 5
     else:
@@ -730,10 +1455,10 @@ def pyroots_batch_loop(dir_in,
         df_out.to_csv(table_out, sep='\t', index=False, mode='w')
 
     else:  # make sure it's compatible
-        temp = pd.read_table(table_out, sep='\t', nrows=1).columns.values
+        temp = _read_header(table_out)
         if len(temp) != ncol:  # same number of columns
             raise ValueError("Cannot Append to Existing Data Table. Different number of columns. Try a new name for the file!")
-        elif sum(temp != df_out.columns.values) > 0:  # same column names
+        elif temp != tuple(df_out.columns):  # same column names
             raise ValueError("Cannot Append to Existing Data Table. Different number of columns. Try a new name for the file!")
 
 
@@ -744,145 +1469,42 @@ def pyroots_batch_loop(dir_in,
     if save_images is True:
         if params is not None:
             print("\nSaving images to {}".format(dir_out))
-        if not os.path.exists(dir_out):
-            os.mkdir(dir_out)
-
-    #Count files to analyze
-    total_files = 0
-    for path, folder, filename in os.walk(dir_in):
-        if dir_out not in path:
-            for f in filename:
-                if f.endswith(extension_in):
-                    total_files += 1
+        os.makedirs(dir_out, exist_ok=True)
+
+    #Find files to analyze
+    images = list(_iter_images(dir_in, extension_in, skip=[dir_out]))
+    total_files = len(images)
     print("\nYou have {} images to analyze".format(total_files))
 
-    #Begin looping
-    out = []  # secondary saving method
-    for path, folder, filename in os.walk(dir_in):
-        if dir_out not in path:   # Don't run in the output directory.
-
-            # Make directory for saving objects
-            subpath = path[len(dir_in)+1:]
-            if not os.path.exists(os.path.join(dir_out, subpath)):
-                os.mkdir(os.path.join(dir_out, subpath))
-
-            # What we'll do:
-            global _core_fn  # bad form for Pool.map() compatibility
-            def _core_fn(filename):
-                if filename.endswith(extension_in):
-                    # count progress.
-
-                    path_in = os.path.join(path, filename)
-                    subpath_in = os.path.join(subpath, filename) # for printing purposes
-                    # Where to write the output image?
-                    filename_out = os.path.splitext(filename)[0] + extension_out
-                    path_out = os.path.join(dir_out, subpath, filename_out)
-
-                    if os.path.exists(path_out): #skip
-                        print("\nALREADY ANALYZED: {}. Skipping...\n".format(subpath_in))
-
-                    else: #(try to) do it
-                        try:
-                            img = io.imread(path_in)  # load image
-                            image_name=os.path.join(subpath, filename)
-
-                            if len(img.shape) != 3:
-                                if len(colors) == 3:
-                                    print("\n{} is not a color image! Skipping...\n".format(subpath_in))
-
-                            if method == 'frangi':
-                                objects_dict = frangi_segmentation(
-                                    img, 
-                                    colors,
-                                    frangi_args,
-                                    threshold_args,
-                                    separate_objects,
-                                    contrast_kernel_size,
-                                    color_args_1,
-                                    color_args_2,
-                                    color_args_3,
-                                    neighborhood_args,
-                                    morphology_args_1,
-                                    morphology_args_2,
-                                    hollow_args,
-                                    fill_gaps_args,
-                                    diameter_args,
-                                    diameter_bins,
-                                    image_name=image_name,
-                                    verbose=False
-                                )
-
-                            elif method == 'thresholding':
-                                objects_dict = thresholding_segmentation(
-                                    img,
-                                    threshold_args,
-                                    image_name,
-                                    colors,
-                                    contrast_kernel_size,
-                                    mask_args,
-                                    noise_removal_args,
-                                    morphology_filter_args,
-                                    fill_gaps_args,
-                                    lw_filter_args,
-                                    diam_filter_args,
-                                    diameter_bins,
-                                    verbose=False
-                                )
-
-                            elif method == 'custom':
-                                raise ValueError(
-                                """No custom function defined. Define it in pyroots/batch_processing.py and 
-                                restart your python session (and comment out this error message)""")
-
-                            else:
-                                raise ValueError(
-                                """Didn't understand what method you wanted. Options are 'frangi', 
-                                'thresholding', and 'custom'""")
-
-
-                            #save images?
-                            if save_images is True:
-                                io.imsave(path_out, img_as_ubyte(255*objects_dict['objects']))  # for black/white printing
-
-                            #Update on progress
-                            #print("Done: {}".format(subpath_in))
-
-                            df_out = objects_dict['geometry']
-                            df_out.insert(0, "Time", strftime("%Y-%m-%d_%H:%M:%S"))
-
-                            df_out.to_csv(table_out, sep=',', index=False, header=False, mode='a')
-
-                        except:
-                            df_out = None
-                            if params is None:  # just list the images that *would* be analyzed
-                                print(subpath_in)
-                            else:
-                                print("\nCouldn't Process: {}.\n     ...Continuing...".format(subpath_in))
-
-
-                        return(df_out)
-
-            # Init threads within each path
-            if threads is None:
-                out += tqdm(map(_core_fn, filename),
-                            total=total_files)
-            else:
-                sleep(1)  # to give everything time to  load
-#                 chunks = min(5, int(total_files/2*threads) + 1)
-#                 if total_files < 5:
-#                     chunks = 1
-                thread_pool = Pool(threads)
-                # Work on _core_fn (and give progressbar)
-                out += tqdm(thread_pool.imap_unordered(_core_fn,
-                                                       filename,
-                                                       chunksize=1),
-                            total=total_files)
-                # finish
-                thread_pool.close()
-                thread_pool.join()
-
-
-    out = pd.concat([i for i in out])
+    # Everything the workers need besides the image itself
+    settings = dict(segmentation_args=loaded,
+                    method=method,
+                    dir_out=dir_out,
+                    extension_out=extension_out,
+                    table_out=table_out,
+                    params=params,
+                    save_images=save_images,
+                    expect_color=len(loaded.get('colors', ())) == 3)
+
+    # One flat list of jobs, so a single pool serves every subdirectory
+    jobs = []
+    for path, filenames in _group_by_path(images).items():
+        # Make directory for saving objects
+        subpath = path[len(dir_in)+1:]
+        os.makedirs(os.path.join(dir_out, subpath), exist_ok=True)
+        jobs += [(path, f, subpath) for f in filenames]
+
+    #Begin looping. The table is written here, as results arrive, in one place.
+    with open(table_out, 'a', newline='') as table:
+        out = _map_jobs(_batch_core_fn, jobs, settings, threads,
+                        on_result=_table_writer(table, df_out.columns))
+
+
+    # skipped and failed images return None
+    out = [i for i in out if i is not None]
+    if len(out) == 0:
+        return(df_out)  # empty, with the table's columns
+    out = pd.concat(out, ignore_index=True, sort=False).reindex(columns=df_out.columns)
     return(out)
     
     
@@ -895,6 +1517,23 @@ def pyroots_batch_loop(dir_in,
 #################################################################################################
 
 
+def _fishnet_core_fn(job):
+    """
+    Worker for `fishnet_loop`. Draws the grid on one image and saves it. `job` is
+    `(file_in, file_out)`.
+    """
+    file_in, file_out = job
+    s = _SETTINGS
+    if os.path.exists(file_out) and not s['overwrite']:
+        return(True)
+
+    image = _imread(file_in)  # decodes straight into one array
+    image = draw_fishnet(image, size=s['size'], grid_color=s['color'], weight=s['weight'])
+    _imsave(file_out, image)
+
+    return(True)
+
+
 def fishnet_loop(dir_in,
                  extension_in,
                  dir_out='fishnet',
@@ -932,7 +1571,7 @@ def fishnet_loop(dir_in,
         do you want to update images in-place? If TRUE, then confirms and sets `dir_out` to 
         `None` and `overwrite` to `True`.
     cores : int
-        For multiprocessing
+        Number of threads. `None` runs in this process.
 
     Returns
     -------
@@ -950,74 +1589,50 @@ def fishnet_loop(dir_in,
     
     if extension_out is None:
         extension_out = extension_in
-    if dir_out is None:
+    if not dir_out:
         dir_out = dir_in
+    else:
+        dir_out = os.path.join(dir_in, dir_out)  # in `dir_in`, unless `dir_out` is a full path
     
     # Count files to analyze for status bar, and make lists of directories
     print("Counting images to screen...")
-    total_files = 0
     subpaths = []
+    subpaths_seen = set()
     files_in = []
     files_out = []
     file_names = []
-    for path, folder, filename in os.walk(dir_in):
-        if dir_out not in path or dir_out is dir_in:
-            for f in filename:
-                if f.endswith(extension_in):
-                    total_files += 1  # index
-
-                    files_in.append(os.path.join(path, f))  # input files
-                    
-                    subpath = path[len(dir_in)+1 :]  # subpaths
-                    test_sub = sum([i == subpath for i in subpaths])
-                    if test_sub==0:
-                        subpaths.append(subpath)  # for making paths later on
-                    
-                    file_names.append(os.path.join(subpath, f)) # image names for a table later
-                    
-                    f_out = os.path.join(dir_out, subpath, f)  # files out = dir_in/dir_out/subpath/image.ext
-                    files_out.append(f_out)
-                    
+    n_dir_in = len(dir_in) + 1
+    skip = [] if dir_out == dir_in else [dir_out]
+    for path, f in _iter_images(dir_in, extension_in, skip=skip):
+        files_in.append(os.path.join(path, f))  # input files
+        
+        subpath = path[n_dir_in:]  # subpaths
+        if subpath not in subpaths_seen:
+            subpaths_seen.add(subpath)
+            subpaths.append(subpath)  # for making paths later on
+        
+        file_names.append(os.path.join(subpath, f)) # image names for a table later
+        
+        f_out = os.path.join(dir_out, subpath, os.path.splitext(f)[0] + extension_out)  # dir_in/dir_out/subpath/image.ext
+        files_out.append(f_out)
+    
+    total_files = len(files_in)
     print("\nYou have {} images to analyze".format(total_files))
     
-    if not os.path.exists(os.path.join(dir_in, dir_out)):
-        os.mkdir(os.path.join(dir_in, dir_out))
-        
+    os.makedirs(dir_out, exist_ok=True)
     for i in subpaths:
-        if not os.path.exists(os.path.join(dir_in, dir_out, i)):
-            os.mkdir(os.path.join(dir_in, dir_out, i))
+        os.makedirs(os.path.join(dir_out, i), exist_ok=True)
             
-    fout = os.path.join(dir_in, dir_out, 'fishnet_images.csv')
+    fout = os.path.join(dir_out, 'fishnet_images.csv')
     with open(fout, 'w') as file:
         print("Image,GridSize_px,Crosses", file=file)
         for i in file_names:
             print("{},{},".format(i, size), file=file)
     
-    global _core_fn
-    def _core_fn(ix):
-        image = io.imread(files_in[ix])
-
-        image = draw_fishnet(image, size=size, grid_color=color, weight=weight)
-
-        if not os.path.exists(files_out[ix]):
-            io.imsave(files_out[ix],
-                      image)
-        elif overwrite:
-            io.imsave(files_out[ix], 
-                      image)
-
-        return
-    
-    sleep(2)  # to give everything time to  load
-    out = []  # for tqdm counting
-
-    with Pool(cores) as thread_pool:
-        out += tqdm(thread_pool.imap_unordered(_core_fn,
-                                               range(total_files),
-                                               chunksize=1),
-                    total=total_files)
-    
-    del globals()['_core_fn']
+    settings = dict(size=size, color=color, weight=weight, overwrite=overwrite)
+    jobs = list(zip(files_in, files_out))
+    # Mostly reading and writing files, which release the GIL. Threads skip pickling the images.
+    out = _map_jobs(_fishnet_core_fn, jobs, settings, cores, backend='threads')  # for tqdm counting
 
     return('Done')
     
@@ -1031,6 +1646,25 @@ def fishnet_loop(dir_in,
 #################################################################################################
 
 
+def _tennant_core_fn(job):
+    """
+    Worker for `tennant_batch`. Counts grid crosses in one image. `job` is
+    `(file_in, file_name)`.
+
+    Returns
+    -------
+    A row for the table: `(file_name, grid_size, crosses, length)`.
+    """
+    file_in, file_name = job
+    grid_size = _SETTINGS['grid_size']
+    image = _imread(file_in)  # decodes straight into one array
+
+    crosses = tennant_on_segmented(image, grid_size=grid_size)
+    tennant_length = (11/14)*grid_size*crosses
+
+    return((file_name, grid_size, crosses, tennant_length))
+
+
 def tennant_batch(dir_in,
                   extension_in, 
                   table_out,
@@ -1078,13 +1712,9 @@ def tennant_batch(dir_in,
     """
     
     colnames = ['Image', 'GridSize_px', 'Crosses', 'Length_px']
-    ncol = 4
     
     if os.path.exists(table_out) and not overwrite:
-            df_out = pd.read_table(table_out, sep=",", nrows=1)
-            temp = df_out.columns.values
-            temp = sum(temp == colnames)
-            if temp != ncol:
+            if _read_header(table_out, sep=',') != tuple(colnames):
                 raise ValueError("Table already exists, and is not compatible with\
                                  the output of this function. Will not overwrite")
     else:
@@ -1092,55 +1722,23 @@ def tennant_batch(dir_in,
         df_out.to_csv(table_out, sep=',', index=False, mode='w')
 
     print("Counting images to screen...")
-    total_files = 0
-    subpaths = []
     files_in = []
     file_names = []
-    for path, folder, filename in os.walk(dir_in):
-        for f in filename:
-            if f.endswith(extension_in):
-                total_files += 1  # index
-
-                files_in.append(os.path.join(path, f))  # input files
-
-                subpath = path[len(dir_in)+1 :]  # subpaths
-                test_sub = sum([i == subpath for i in subpaths])
-                if test_sub==0:
-                    subpaths.append(subpath)  # for making paths later on
+    n_dir_in = len(dir_in) + 1
+    for path, f in _iter_images(dir_in, extension_in):
+        files_in.append(os.path.join(path, f))  # input files
+        file_names.append(os.path.join(path[n_dir_in:], f)) # image names for a table later
 
-                file_names.append(os.path.join(subpath, f)) # image names for a table later
-                    
+    total_files = len(files_in)
     print("\nYou have {} images to analyze".format(total_files))
     
-#     for ix in tqdm(range(total_files)):
-    global _core_fn
-    def _core_fn(ix):
-        image = io.imread(files_in[ix])
-        
-        crosses = tennant_on_segmented(image, grid_size=grid_size)
-        tennant_length = (11/14)*grid_size*crosses
-        
-        temp_out = pd.DataFrame(data={'Image': [file_names[ix]],
-                                      'GridSize_px': [grid_size],
-                                      'Crosses': [crosses],
-                                      'Length_px': [tennant_length]
-                                     })
-        temp_out = temp_out[colnames]
-        temp_out.to_csv(table_out, sep=",", index=False, header=False, mode='a')
-        
-        return(temp_out)
-        
-    
-    sleep(0.5)  # to give everything time to  load
-    out = []  # for tqdm counting
-    with Pool(cores) as thread_pool:
-        out += tqdm(thread_pool.imap_unordered(_core_fn,
-                                               range(total_files),
-                                               chunksize=1),
-                    total=total_files)
-    
-    del globals()['_core_fn']
-    
-    df_out = pd.concat([i for i in out])
+    settings = dict(grid_size=grid_size)
+    jobs = list(zip(files_in, file_names))
+    chunks = max(1, total_files // (cores*4)) if cores else 1  # cheap jobs; batch them
+    with open(table_out, 'a', newline='') as table:  # rows are written here as they arrive
+        out = _map_jobs(_tennant_core_fn, jobs, settings, cores, chunks,
+                        on_result=_table_writer(table, colnames, sep=','))
+
+    df_out = pd.DataFrame(out, columns=colnames)
 
     return(df_out)
@@ -14,9 +14,80 @@ import pandas as pd
 from pyroots import *
 from skimage import io, color, filters, morphology, img_as_ubyte, img_as_float
 import importlib
+import inspect
 import numpy as np
 from warnings import warn
 
+
+def _convert_colorspace(image, color_args, converted):
+    """
+    `image` in the colorspace of `color_args`, for `pyroots.color_filter`. `converted` is a
+    dictionary of conversions already made, so that each colorspace is computed once per image.
+    """
+    colorspace = color_args['colorspace'].lower()
+    if colorspace not in converted:
+        if colorspace == 'rgb':
+            converted[colorspace] = image
+        else:
+            converted[colorspace] = getattr(color, "rgb2" + colorspace)(image)
+    return(converted[colorspace])
+
+
+def _tiled_frangi(image, tile=1024, **frangi_args):
+    """
+    `skimage.filters.frangi` computed on overlapping tiles, so that the hessian and eigenvalue
+    arrays for each scale are allocated per tile rather than for the whole image. This bounds
+    memory use per worker for large images. Each tile is padded by the radius of the largest
+    gaussian kernel, so the result matches filtering the whole image.
+
+    Parameters
+    ----------
+    image : ndarray
+        2D image.
+    tile : int
+        Side length of the (unpadded) tiles.
+    frangi_args : dict
+        Parameters to pass to `skimage.filters.frangi`
+
+    Returns
+    -------
+    Filtered image, as from `skimage.filters.frangi`.
+
+    Notes
+    -----
+    If `gamma` is `None`, `skimage.filters.frangi` scales its output by the maximum over the
+    whole image, which tiles cannot reproduce; the whole image is filtered at once instead.
+
+    """
+    defaults = inspect.signature(filters.frangi).parameters
+    def _arg(name):
+        if name in frangi_args:
+            return(frangi_args[name])
+        elif name in defaults:
+            return(defaults[name].default)
+        return(None)
+
+    if _arg('gamma') is None or max(image.shape) <= tile:
+        return(filters.frangi(image, **frangi_args))
+
+    # the largest sigma sets the overlap. scale_range's upper bound is exclusive, so it's safe.
+    max_sigma = max(np.max(i) for i in [_arg('sigmas'), _arg('scale_range')] if i is not None)
+    pad = int(np.ceil(4*max_sigma)) + 3  # gaussian truncates at 4 sigma, +2 for gradients
+
+    rows, cols = image.shape
+    out = None
+    for y in range(0, rows, tile):
+        for x in range(0, cols, tile):
+            y0, x0 = max(y - pad, 0), max(x - pad, 0)
+            temp = filters.frangi(image[y0:min(y + tile + pad, rows), x0:min(x + tile + pad, cols)],
+                                  **frangi_args)
+            if out is None:
+                out = np.empty(image.shape, dtype=temp.dtype)
+            out[y:y+tile, x:x+tile] = temp[y-y0:y-y0+tile, x-x0:x-x0+tile]
+
+    return(out)
+
+
 def frangi_segmentation(image, 
                         colors,
                         frangi_args, 
@@ -129,7 +200,7 @@ def frangi_segmentation(image,
         if verbose:
             print("Contrast enhanced")
     except:
-        if contrast_kernel_size is not 'skip':
+        if contrast_kernel_size != 'skip':
             warn('Skipping contrast enhancement')
         pass
         
@@ -151,7 +222,7 @@ def frangi_segmentation(image,
             temp = temp > filters.threshold_otsu(temp)
             edge_val = np.sum(temp) / np.sum(np.ones_like(temp))
 
-            edges_temp = temp.copy()
+            edges_temp = temp
 
         if sigma_val[i] == 0.25: # try without smoothing
             temp = filters.scharr(working_image[i])
@@ -159,7 +230,7 @@ def frangi_segmentation(image,
             edge_val = np.sum(temp) / np.sum(np.ones_like(temp))
             if edge_val <= 0.1:
                 sigma_val[i] = 0
-                edges_temp = temp.copy()
+                edges_temp = temp
             
         if separate_objects:
             edges[i] = morphology.skeletonize(edges_temp)
@@ -172,12 +243,12 @@ def frangi_segmentation(image,
     # Frangi vessel enhancement
     for i in range(nbands):
         temp = filters.gaussian(working_image[i], sigma=sigma_val[i])
-        temp = filters.frangi(temp, **frangi_args[i])
+        temp = _tiled_frangi(temp, **frangi_args[i])
         temp = 1 - temp/np.max(temp)
         temp = temp < filters.threshold_local(temp, **threshold_args[i])
-        working_image[i] = temp.copy()
+        working_image[i] = temp
     
-    frangi = working_image.copy()
+    frangi = working_image
     if verbose:
         print("Frangi filter, threshold complete")
     
@@ -186,33 +257,40 @@ def frangi_segmentation(image,
     combined = working_image[0] * ~edges[0]
     for i in range(1, nbands):
         combined = combined * working_image[i] * ~edges[i]
-    working_image = combined.copy()
+    working_image = combined
     
     # Filter candidate objects by color
+    converted = {}  # colorspace conversions of `image`, shared by the color filters
     try:
-        color1 = color_filter(image, working_image, **color_args_1)  #colorspace, target_band, low, high, percent)
+        color1 = color_filter(image, working_image, 
+                              converted=_convert_colorspace(image, color_args_1, converted), 
+                              **color_args_1)  #colorspace, target_band, low, high, percent)
         if verbose:
             print("Color filter 1 complete")
     except:
-        if color_args_1 is not 'skip':
+        if color_args_1 != 'skip':
             warn("Skipping Color Filter 1")
         color1 = np.ones(working_image.shape)  # no filtering      
 
     try:
-        color2 = color_filter(image, working_image, **color_args_2)  # nesting equates to an "and" statement.
+        color2 = color_filter(image, working_image,  # nesting equates to an "and" statement.
+                              converted=_convert_colorspace(image, color_args_2, converted), 
+                              **color_args_2)
         if verbose:
             print("Color filter 2 complete")   
     except:
-        if color_args_2 is not 'skip':
+        if color_args_2 != 'skip':
             warn("Skipping Color Filter 2")
         color2 = np.ones(working_image.shape)  # no filtering
     
     try:
-        color3 = color_filter(image, working_image, **color_args_3)  # nesting equates to an "and" statement.
+        color3 = color_filter(image, working_image,  # nesting equates to an "and" statement.
+                              converted=_convert_colorspace(image, color_args_3, converted), 
+                              **color_args_3)
         if verbose:
             print("Color filter 3 complete")
     except:
-        if color_args_3 is not 'skip':
+        if color_args_3 != 'skip':
             warn("Skipping Color Filter 3")
         color3 = np.ones(working_image.shape)  # no filtering
     
@@ -232,11 +310,17 @@ def frangi_segmentation(image,
             rm_edges = rm_edges * temp[i]
         
         # filter by color per criteria above
-        try:    color1 = color_filter(image, rm_edges, **color_args_1)
+        try:    color1 = color_filter(image, rm_edges, 
+                                    converted=_convert_colorspace(image, color_args_1, converted), 
+                                    **color_args_1)
         except: color1 = np.ones(rm_edges.shape)
-        try:    color2 = color_filter(image, rm_edges, **color_args_2)
+        try:    color2 = color_filter(image, rm_edges, 
+                                    converted=_convert_colorspace(image, color_args_2, converted), 
+                                    **color_args_2)
         except: color2 = np.ones(rm_edges.shape)
-        try:    color3 = color_filter(image, rm_edges, **color_args_3)
+        try:    color3 = color_filter(image, rm_edges, 
+                                    converted=_convert_colorspace(image, color_args_3, converted), 
+                                    **color_args_3)
         except: color3 = np.ones(rm_edges.shape)
         
         # Combine color filters
@@ -263,7 +347,7 @@ def frangi_segmentation(image,
         if verbose:
             print("Morphology filter 1 complete")
     except:
-        if morphology_args_1 is not 'skip':
+        if morphology_args_1 != 'skip':
             warn("Skipping morphology filter 1")
         pass        
     
@@ -273,12 +357,12 @@ def frangi_segmentation(image,
         if verbose:
             print("Neighborhood filter complete")
     except:
-        if neighborhood_args is not 'skip':
+        if neighborhood_args != 'skip':
             warn("Skipping neighborhood filter")
         pass
     
     # Filter candidate objects by hollowness
-    if hollow_args is not 'skip':  
+    if hollow_args != 'skip':  
         temp = morphology.remove_small_holes(working_image, min_size=10)
         try:
             if np.sum(temp) > 0:
@@ -295,7 +379,7 @@ def frangi_segmentation(image,
         if verbose:
             print("Gap filling complete")
     except:
-        if fill_gaps_args is not 'skip':
+        if fill_gaps_args != 'skip':
             warn("Skipping filling gaps")
         pass
     
@@ -305,7 +389,7 @@ def frangi_segmentation(image,
         if verbose:
             print("Morphology filter 2 complete")
     except:
-        if morphology_args_2 is not 'skip':
+        if morphology_args_2 != 'skip':
             warn("Skipping morphology filter 2")
         pass
         
@@ -321,12 +405,12 @@ def frangi_segmentation(image,
             print("Diameter filter complete")
     except:
         diam = skel.copy()
-        if diameter_args is not 'skip':
+        if diameter_args != 'skip':
             warn("Skipping diameter filter")
         pass
     
     # Summarize
-    if diameter_bins is None or diameter_bins is 'skip':
+    if diameter_bins is None or diameter_bins == 'skip':
         summary_df = summarize_geometry(diam['geometry'], image_name)
 
     else:
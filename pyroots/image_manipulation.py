@@ -434,12 +434,12 @@ def _disk(radius):
     """
     Improved version of morphology.disk(), which gives expected behavior for
     floats as well as integers and gives a fuller disk for small radii. It sets
-    the radius to `radius` + 0.5 pixels.
+    the radius to `radius` + 0.5 pixels. Returns `uint8`, as OpenCV needs.
     """
 
     coords = np.arange(-round(radius,0), round(radius,0)+1)
-    X, Y = np.meshgrid(coords, coords)
-    disk_out = 1*np.array((X**2 + Y**2) < (radius+0.5)**2)
+    # broadcast a column against a row, rather than building two meshgrids
+    disk_out = (coords[:, None]**2 + coords[None, :]**2 < (radius+0.5)**2).astype(np.uint8)
         # round improves behavior with irrational radii
     return(disk_out)
 
@@ -545,7 +545,7 @@ def band_selector(image, colors):
         
         # pull bands
         if len(working_image.shape) == 3:  # excludes rgb2gray
-            working_image = [img_split(working_image)[i] for i in colors['band']]
+            working_image = [working_image[:, :, i] for i in colors['band']]
         else:
             working_image = [working_image]
             nbands = 1
@@ -12,7 +12,6 @@ neighborhod_filter - Filters candidate objects based on pixels near them
 from scipy import ndimage
 import numpy as np
 from skimage import img_as_float, measure, morphology, color
-from pyroots.image_manipulation import img_split
 
 def neighborhood_filter(image, objects, max_diff=0.1, gap=4, neighborhood_depth=4, colorspace='rgb', band=2, return_band=False):
     """
@@ -63,7 +62,7 @@ def neighborhood_filter(image, objects, max_diff=0.1, gap=4, neighborhood_depth=
         if colorspace.lower() != 'rgb':
             image = getattr(color, 'rgb2' + colorspace)(image)
         if len(image.shape) == 3:
-            image = img_split(image)[band]
+            image = image[:, :, band]
     
     image = img_as_float(image)
     its = int((neighborhood_depth+2)/2)
@@ -11,10 +11,10 @@ Various methods for filtering and cleaning up candidate objects.
 - grayscale_filter, color_filter: based on object values in individual bands of different colorspaces.
 """
 
-from scipy import ndimage
-from skimage import morphology, filters, color, img_as_float
+from scipy import ndimage, signal
+from skimage import color, img_as_float
 import numpy as np
-from pyroots.image_manipulation import img_split
+import cv2
 
 
 #########################################################################################################################
@@ -43,18 +43,24 @@ def _in_range(image, low, high):
     -------
     A boolean ndarray
     """
-    img = img_as_float(image)
+    if image.dtype in (np.uint8, np.uint16):
+        # Look up each pixel's answer rather than converting the whole image to float
+        values = img_as_float(np.arange(np.iinfo(image.dtype).max + 1, dtype=image.dtype))
+        return(_in_range(values, low, high)[image])
+
+    if image.dtype.kind != 'f':  # floats are already on the right scale
+        image = img_as_float(image)
 
     # rotate so that low = 0. For polar scales (hue of hsv). Arbitrary for
-    img = img - low
-    img_a = img + 1
-    img[img<0] = img[img<0] + 1  # negative numbers get moved to the top.
+    img = image - low  # new array; `image` is left alone
+    img[img < 0] += 1  # negative numbers get moved to the top.
 
     new_high = high - low
     if new_high < 0:
         new_high += 1
 
-    out = (img >= 0) * (img <= new_high)
+    out = img >= 0
+    out &= img <= new_high
     return(out)
 
 
@@ -83,14 +89,16 @@ def grayscale_filter(image, objects, low, high, percent, invert=False):
     -------
     An updated objects image.
     """
-    labels = ndimage.label(objects)[0]
+    labels, labels_ls = ndimage.label(objects)
+    flat = labels.ravel()
 
-    # Calculate area of objects
-    binary_area = ndimage.sum(objects, labels=labels, index=range(labels.max()+1))
+    # Calculate area of objects, by counting each label
+    binary_area = np.bincount(flat, minlength=labels_ls+1)
+    binary_area[0] = max(binary_area[0], 1)  # background, in case objects fill the image
 
     # Calculate number of pixels in range for each object
     in_range = _in_range(image, low, high)      # flag image pixel values
-    in_range_area = ndimage.sum(in_range, labels=labels, index=range(labels.max()+1))
+    in_range_area = np.bincount(flat[in_range.ravel()], minlength=binary_area.size)
        # Calculate area of in-range pixels for each object
 
     # Do percentage of pixels in range meet threshold?
@@ -105,7 +113,7 @@ def grayscale_filter(image, objects, low, high, percent, invert=False):
 
     return(out_objects)
 
-def color_filter(image, objects, colorspace, target_band, low, high, percent, invert=False):
+def color_filter(image, objects, colorspace, target_band, low, high, percent, invert=False, converted=None):
     """
     Wrapper for `pyroots.grayscale_filter`. Adds functionality to (optionally) convert an rgb image to
     a selected colorspace, and choose a single band from that colorspace. Tests whether `percent` of pixels
@@ -129,6 +137,9 @@ def color_filter(image, objects, colorspace, target_band, low, high, percent, in
         Percent of pixels that must be within (low:high). [0, 100].
     invert : bool
         Are you selecting objects that you don't want to keep?
+    converted : ndarray or `None`
+        `image` already converted to `colorspace`, to skip converting it again when filtering
+        several bands of the same colorspace. If `None`, converts `image`.
 
     Returns
     -------
@@ -136,12 +147,14 @@ def color_filter(image, objects, colorspace, target_band, low, high, percent, in
 
     """
     # convert rgb image if necessary, select band.
-    if colorspace.lower() !='rgb':
+    if converted is not None:
+        colorband = converted
+    elif colorspace.lower() !='rgb':
         colorband = getattr(color, "rgb2" + colorspace.lower())(image)
     else:
-        colorband = image.copy()
+        colorband = image  # only read
 
-    colorband = img_split(colorband)[target_band]
+    colorband = colorband[:, :, target_band]  # a view of the one band needed
 
     # Filter color
     out = grayscale_filter(colorband, objects, low, high, percent, invert)
@@ -160,16 +173,42 @@ def _disk(radius):
     """
     Improved version of morphology.disk(), which gives expected behavior for
     floats as well as integers and gives a fuller disk for small radii. It sets
-    the radius to `radius` + 0.5 pixels.
+    the radius to `radius` + 0.5 pixels. Returns `uint8`, as OpenCV needs.
     """
 
     coords = np.arange(-round(radius,0), round(radius,0)+1)
-    X, Y = np.meshgrid(coords, coords)
-    disk_out = 1*np.array((X**2 + Y**2) < (radius+0.5)**2)
+    # broadcast a column against a row, rather than building two meshgrids
+    disk_out = (coords[:, None]**2 + coords[None, :]**2 < (radius+0.5)**2).astype(np.uint8)
         # round improves behavior with irrational radii
     return(disk_out)
 
 
+def _fft_dilation(img, strel):
+    """
+    Binary dilation of `img` by `strel` as a convolution, by FFT. Pixels outside the image
+    are background, as in `cv2.dilate`. `strel` must have odd dimensions.
+    """
+    img = signal.fftconvolve(np.asarray(img, dtype=np.float32), 
+                             np.asarray(strel[::-1, ::-1], dtype=np.float32), 
+                             mode='same')
+    return(img > 0.5)
+
+
+def _fft_erosion(img, strel):
+    """
+    Binary erosion of `img` by `strel` as a convolution, by FFT. Pixels outside the image
+    are ignored, as in `cv2.erode`. `strel` must have odd dimensions.
+    """
+    pad_y, pad_x = strel.shape[0]//2, strel.shape[1]//2
+    img = np.pad(np.asarray(img, dtype=np.float32), ((pad_y, pad_y), (pad_x, pad_x)), 
+                 constant_values=1)  # so edges don't erode
+    img = signal.fftconvolve(img, 
+                             np.asarray(strel[::-1, ::-1], dtype=np.float32), 
+                             mode='same')
+    img = img[pad_y:img.shape[0]-pad_y, pad_x:img.shape[1]-pad_x]
+    return(img > np.count_nonzero(strel) - 0.5)  # every pixel under `strel` is foreground
+
+
 def noise_removal(img, radius_1=1, radius_2=2, median_iterations=3):
     """
     Cleans a binary image by separating loosely connected objects, eliminating
@@ -196,7 +235,7 @@ def noise_removal(img, radius_1=1, radius_2=2, median_iterations=3):
 
     See Also
     --------
-    In ``scipy.ndimage``, see ``skimage.morphology.binary_opening``,
+    ``cv2.morphologyEx`` and ``cv2.filter2D``, equivalent to ``skimage.morphology.binary_opening``,
     ``skimage.morphology.binary_closing``, and ``skimage.filters.median``
 
     """
@@ -204,22 +243,36 @@ def noise_removal(img, radius_1=1, radius_2=2, median_iterations=3):
     if len(np.array([radius_1]).shape) == 1:
         ELEMENT_1 = _disk(radius=radius_1)
     else:
-        ELEMENT_1 = structure_1
+        ELEMENT_1 = np.asarray(radius_1)
 
     if len(np.array([radius_2]).shape) == 1:
         ELEMENT_2 = _disk(radius=radius_2)
     else:
-        ELEMENT_2 = structure_2
+        ELEMENT_2 = np.asarray(radius_2)
+
+    if np.count_nonzero(ELEMENT_1) > 2000 and ELEMENT_1.shape[0] % 2 and ELEMENT_1.shape[1] % 2:
+        # Large elements (radius > ~25). OpenCV's time grows with the size of the element;
+        # FFT's does not. Same output.
+        out = _fft_dilation(_fft_erosion(img, ELEMENT_1), ELEMENT_1)
+        out = _fft_erosion(_fft_dilation(out, ELEMENT_1), ELEMENT_1)
 
-    out = morphology.binary_opening(img, selem=ELEMENT_1)
-    out = morphology.binary_closing(out, selem=ELEMENT_1)
+    else:
+        # OpenCV's morphology is much faster than skimage's, but needs uint8 images and kernels.
+        # Pixels outside the image are ignored, as in skimage.
+        kernel = ELEMENT_1.astype(np.uint8)
+        out = cv2.morphologyEx(np.asarray(img, dtype=np.uint8), cv2.MORPH_OPEN, kernel)
+        out = cv2.morphologyEx(out, cv2.MORPH_CLOSE, kernel).astype(bool)
 
-    i = 0
-    while i < median_iterations:
-        out = filters.median(out, selem=ELEMENT_2)
-        i += 1
+    # The median of a binary image is a majority vote of the pixels under ELEMENT_2, so count
+    # them with an OpenCV convolution. Same as `skimage.filters.median`, edges included.
+    kernel = (ELEMENT_2 != 0).astype(np.float32)
+    n = np.count_nonzero(kernel)
+    out = out.astype(np.uint8)
+    for i in range(median_iterations):
+        votes = cv2.filter2D(out, cv2.CV_32F, kernel, borderType=cv2.BORDER_REPLICATE)
+        out = (votes >= n - n//2).astype(np.uint8)
 
-    return(out)
+    return(out.astype(bool))
 
 
 #########################################################################################################################
@@ -256,18 +309,19 @@ def dirt_removal(img, method="gaussian", param=5):
     """
 
     labels, labels_ls = ndimage.label(img)
-    area = ndimage.sum(img, labels=labels, index=range(labels_ls))
-
-    if method is "gaussian": #ID 'real' objects
-        area_filt = area > np.median(area) + param*np.std(area)
-    elif method is "threshold":
-        area_filt = area > param
+    if labels_ls == 0:  # no objects
+        return(np.zeros(labels.shape, dtype=bool))
+    area = np.bincount(labels.ravel(), minlength=labels_ls+1)[1:]  # pixels per object, without background
+
+    if method == "gaussian": #ID 'real' objects
+        cutoff = np.median(area) + param*np.std(area)
+    elif method == "threshold":
+        cutoff = param
     else:
-        print("method should be 'gaussian' or 'threshold'!")
+        raise ValueError("method should be 'gaussian' or 'threshold'!")
 
-    keep_ID = [i for i, x in enumerate(area_filt) if x == True] #Select labels of 'real' objects
-    filt = np.in1d(labels, keep_ID) #reshape to image size
-    filt = np.reshape(filt, img.shape)
+    area_filt = np.concatenate(([False], area > cutoff))  # never keep the background (label 0)
+    filt = area_filt[labels]  # look up each pixel's label; same shape as the image
     return(filt)
 
 
@@ -9,8 +9,8 @@ Contents:
 - preprocessing_filters
 """
 import numpy as np
-from skimage import filters, img_as_ubyte, exposure, color, morphology
-from pyroots import img_split, _center_image, draw_mask
+from skimage import filters, img_as_ubyte, img_as_float, exposure, color, morphology
+from pyroots import _center_image, draw_mask
 import cv2
 from warnings import warn
 import colour
@@ -44,18 +44,31 @@ def detect_motion_blur(image, ratio=2, band=None):
 
     """
     if band is None:
-        try:
-            analyze = image[:, :, 0].copy()
-        except:
-            analyze = image.copy()
-            pass
+        band = 0
+    if image.ndim == 3:
+        analyze = image[:, :, band]  # only read
+    else:
+        analyze = image
+
+    # Same as `img_as_ubyte(filters.prewitt_v(analyze)).var()` and `prewitt_h`, but with
+    # OpenCV's separable filters on the original values: [-1, 0, 1] across, mean of 3 along.
+    if analyze.dtype.kind in 'ui':
+        scale = 255 / np.iinfo(analyze.dtype).max
     else:
-        analyze = image[:, :, band]
+        scale = 255
+    if analyze.dtype not in (np.uint8, np.uint16, np.float32):  # what OpenCV can filter to float32
+        analyze = analyze.astype(np.float32)
+    diff = np.array([-scale, 0, scale], dtype=np.float32)
+    mean = np.full(3, 1/3, dtype=np.float32)
 
-    horiz = img_as_ubyte(filters.prewitt_v(analyze)).var()
-    vert = img_as_ubyte(filters.prewitt_h(analyze)).var()
+    variances = []
+    for kernel_x, kernel_y in [(diff, mean), (mean, diff)]:  # horizontal, then vertical gradient
+        edges = cv2.sepFilter2D(analyze, cv2.CV_32F, kernel_x, kernel_y, borderType=cv2.BORDER_REFLECT)
+        np.clip(edges, 0, 255, out=edges)  # as `img_as_ubyte`
+        np.rint(edges, out=edges)
+        variances.append(edges.var())
 
-    test = horiz / vert
+    test = variances[0] / variances[1]
 
     if test < ratio and test > 1/ratio:
         out = True
@@ -98,9 +111,9 @@ def calc_temperature_distance(image, percentiles, max_distance):
     `colour.uv_to_CCT_Robertson1968`, `skimage.color.rgb2luv`
     """
     luv = color.rgb2luv(_center_image(image))
-    u = [np.percentile(luv[:, :, 1], i) for i in percentiles]
-    v = [np.percentile(luv[:, :, 2], i) for i in percentiles]
-    dist = [colour.uv_to_CCT_Robertson1968((u[i], v[i]))[1] for i in range(len(percentiles))]
+    # every percentile of u and v, from one partial sort per band
+    uv = np.percentile(luv[:, :, 1:].reshape(-1, 2), percentiles, axis=0).reshape(-1, 2)
+    dist = [colour.uv_to_CCT_Robertson1968((u, v))[1] for u, v in uv]
     dist = np.mean(dist)
 
     if max_distance == None:
@@ -145,24 +158,100 @@ def correct_brightfield(image, brightfield, correction_factor='auto'):
     0.1% and 5% of the total area of the image. This function sets a ceiling of output values at 255.
 
     """
-    if correction_factor is 'auto':
-        correction_factor = 1
+    correction_factor = _brightfield_correction_factor(image, brightfield, correction_factor)
+
+    # single precision is plenty for 8-bit images, and halves the memory traffic
+    out = np.multiply(brightfield, np.float32(correction_factor), dtype=np.float32)
+    np.divide(image, out, out=out)  # reuse the denominator's buffer
+    np.minimum(out, 1, out=out)
+
+    out = img_as_ubyte(out)
+    return(out)
+
+
+def _brightfield_correction_factor(image, brightfield, correction_factor='auto'):
+    """
+    Returns `correction_factor` for `pyroots.correct_brightfield`, choosing it if `'auto'`.
+    """
+    if correction_factor == 'auto':
+        overexposure = _overexposure_counter(image, brightfield)
+        test_factor = 1
         overexp = 1
-        while overexp > 0.05 and correction_factor < 1.3:
-            out = image / (brightfield * correction_factor)
-            overexp = np.sum(out > 1) / np.sum(np.ones_like(out))
-            correction_factor += 0.02
-
-        while overexp < 0.001 and correction_factor > 0.7:
-            out = image/(brightfield * correction_factor)
-            overexp = np.sum(out > 1) / np.sum(np.ones_like(out))
-            correction_factor -= 0.02
+        while overexp > 0.05 and test_factor < 1.3:
+            overexp = overexposure(test_factor)
+            correction_factor = test_factor
+            test_factor += 0.02
+
+        while overexp < 0.001 and test_factor > 0.7:
+            overexp = overexposure(test_factor)
+            correction_factor = test_factor
+            test_factor -= 0.02
+
+    return(correction_factor)
+
+
+def _overexposure_counter(image, brightfield):
+    """
+    Returns a function giving the fraction of `image / (brightfield * test_factor)` that is
+    over 1, for `_brightfield_correction_factor`. For uint8 images, counts each pair of
+    values once, so each test factor is checked against at most 65536 pairs rather than
+    the whole image. The comparison is the same, so the result is too.
+    """
+    image, brightfield = np.broadcast_arrays(image, brightfield)
+    size = image.size
+
+    if image.dtype == np.uint8 and brightfield.dtype == np.uint8:
+        pairs = np.bincount(((image.astype(np.uint16) << 8) | brightfield).ravel(), minlength=65536)
+        present = np.flatnonzero(pairs)
+        counts = pairs[present]
+        image = (present >> 8).astype(np.uint8)
+        brightfield = (present & 255).astype(np.uint8)
     else:
-        out = image / (brightfield * correction_factor)
-    
-    out[out>1] = 1
+        counts = None
+
+    def overexposure(test_factor):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            over = image / (brightfield * test_factor) > 1
+        if counts is None:
+            return(np.sum(over) / size)
+        return(np.sum(counts[over]) / size)
+
+    return(overexposure)
+
+
+def _correct_and_smooth(image, brightfield, smoothing_params, correction_factor='auto', tile=256):
+    """
+    `pyroots.correct_brightfield` followed by `cv2.bilateralFilter(out, -1, **smoothing_params)`,
+    fused into one pass over horizontal bands of `tile` rows. Each band is corrected in a
+    reused scratch buffer with enough overlap for the filter, so the full-size corrected
+    image is never stored. Gives the same result as running the two steps separately.
+    """
+    correction_factor = _brightfield_correction_factor(image, brightfield, correction_factor)
+
+    # rows above and below each band that the bilateral filter reads
+    pad = max(int(round(smoothing_params['sigmaSpace'] * 1.5)), 1) + 1
+
+    height = image.shape[0]
+    out = np.empty(image.shape, dtype=np.uint8)
+    scratch = np.empty((tile + 2*pad,) + image.shape[1:], dtype=np.float32)  # reused for each band
+    denominator = np.empty_like(scratch)
+
+    for y0 in range(0, height, tile):
+        y1 = min(y0 + tile, height)
+        top = max(y0 - pad, 0)
+        bottom = min(y1 + pad, height)
+        n = bottom - top
+
+        # brightfield correction, as in `correct_brightfield`
+        np.multiply(brightfield[top:bottom], np.float32(correction_factor), out=denominator[:n])
+        np.divide(image[top:bottom], denominator[:n], out=scratch[:n])
+        np.minimum(scratch[:n], 1, out=scratch[:n])
+        corrected = img_as_ubyte(scratch[:n])
+
+        # smoothing; keep only rows that had their whole neighborhood
+        smoothed = cv2.bilateralFilter(corrected, -1, **smoothing_params)
+        out[y0:y1] = smoothed[y0-top : y0-top + (y1-y0)]
 
-    out = img_as_ubyte(out)
     return(out)
 
 ###############################################################################################
@@ -170,6 +259,32 @@ def correct_brightfield(image, brightfield, correction_factor='auto'):
 #########                             Band Registration                          ##############
 #########                                                                        ##############
 ###############################################################################################
+def _align_band(template_edges, band_edges, band, ECC_criterion=True):
+    """
+    Align `band` to the template band in `pyroots.register_bands`, by an affine transformation
+    estimated from the edges of each.
+    """
+    height, width = band.shape
+
+    # Estimate transformation
+    warp_matrix = np.array(cv2.estimateRigidTransform(template_edges,
+                                                      band_edges,
+                                                      fullAffine=False), dtype=np.float32)
+
+    if ECC_criterion == True:
+        # Optimize using ECC criterion and default settings
+        warp_matrix = cv2.findTransformECC(template_edges,
+                                           band_edges,
+                                           warpMatrix=warp_matrix)[1]
+    # transform
+    aligned = cv2.warpAffine(band,
+                             warp_matrix,
+                             (width, height),
+                             flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP,  # otherwise the transformation goes the wrong way
+                             borderMode=cv2.BORDER_CONSTANT)
+    return(aligned)
+
+
 def register_bands(image, template_band=1, ECC_criterion=True):
     """
     Fix chromatic abberation in images by calculating and applying an affine
@@ -211,16 +326,24 @@ def register_bands(image, template_band=1, ECC_criterion=True):
             analyze.append(i)
             
     # Extract bands, find edges
-    bands = img_split(image)
-    edges = [np.ones_like(i) for i in bands]
+    bands = cv2.split(image)  # contiguous bands, ready for OpenCV
+    edges = np.empty((depth, height, width), dtype=np.uint8)  # one buffer for every band's edges
     for i in range(len(bands)):
+        if bands[i].dtype.kind == 'u':
+            # the same values as `img_as_float`, without the float64 intermediate
+            band = np.divide(bands[i], np.iinfo(bands[i].dtype).max, dtype=np.float32)
+        else:
+            band = img_as_float(bands[i]).astype(np.float32)
         sigma_val = 0.25
         edge_val = 1
         while edge_val > 0.1 and sigma_val < 10:
-            temp = filters.gaussian(bands[i], sigma=sigma_val)
-            scharr = filters.scharr(temp)
+            # `filters.gaussian`, then `filters.scharr`, in OpenCV
+            temp = cv2.GaussianBlur(band, (0, 0), sigma_val, borderType=cv2.BORDER_REPLICATE)
+            scharr = cv2.magnitude(cv2.Scharr(temp, cv2.CV_32F, 1, 0, scale=1/16, borderType=cv2.BORDER_REFLECT),
+                                   cv2.Scharr(temp, cv2.CV_32F, 0, 1, scale=1/16, borderType=cv2.BORDER_REFLECT))
+            scharr *= np.sqrt(0.5)
             temp = scharr > filters.threshold_otsu(scharr)
-            edge_val = np.sum(temp) / np.sum(np.ones_like(temp))
+            edge_val = np.count_nonzero(temp) / temp.size
             sigma_val = 2*sigma_val
         edges[i] = img_as_ubyte(scharr * temp)
 
@@ -230,50 +353,14 @@ def register_bands(image, template_band=1, ECC_criterion=True):
 
     try:
         for i in analyze:
-            # Estimate transformation
-            warp_matrix = np.array(cv2.estimateRigidTransform(edges[template_band],
-                                                     edges[i],
-                                                     fullAffine=False), dtype=np.float32)
-
-            if ECC_criterion == True:
-                # Optimize using ECC criterion and default settings
-                warp_matrix = cv2.findTransformECC(edges[template_band],
-                                                   edges[i],
-                                                   warpMatrix=warp_matrix)[1]
-            # transform
-            aligned = cv2.warpAffine(bands[i],
-                                     warp_matrix,
-                                     (width, height),
-                                     flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP,  # otherwise the transformation goes the wrong way
-                                     borderMode=cv2.BORDER_CONSTANT)
-
-            # add to color image
-            out[:, :, i] = aligned
+            out[:, :, i] = _align_band(edges[template_band], edges[i], bands[i], ECC_criterion)
     
     except:
         # Probably few objects, so no smoothing and no thresholding to have as much info as possible
         edges = [img_as_ubyte(filters.scharr(i)) for i in edges]
         
         for i in analyze:
-            # Estimate transformation
-            warp_matrix = np.array(cv2.estimateRigidTransform(edges[template_band],
-                                                     edges[i],
-                                                     fullAffine=False), dtype=np.float32)
-
-            if ECC_criterion == True:
-                # Optimize using ECC criterion and default settings
-                warp_matrix = cv2.findTransformECC(edges[template_band],
-                                                   edges[i],
-                                                   warpMatrix=warp_matrix)[1]
-            # transform
-            aligned = cv2.warpAffine(bands[i],
-                                     warp_matrix,
-                                     (width, height),
-                                     flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP,  # otherwise the transformation goes the wrong way
-                                     borderMode=cv2.BORDER_CONSTANT)
-
-            # add to color image
-            out[:, :, i] = aligned
+            out[:, :, i] = _align_band(edges[template_band], edges[i], bands[i], ECC_criterion)
             
     return(img_as_ubyte(out))
 
@@ -287,7 +374,8 @@ def preprocessing_filters(image,
                           blur_params=None,
                           temperature_params=None,
                           low_contrast_params=None,
-                          center=True):
+                          center=True,
+                          scale=1):
 
 
     """
@@ -307,6 +395,9 @@ def preprocessing_filters(image,
         parameters for `skimage.exposure.is_low_contrast`
     center : bool
         Take middle 25% of an image for blur detection?
+    scale : int
+        Factor by which `image` is reduced from full size (ex. a thumbnail). Scales the
+        smoothing before the low contrast check to match.
 
     Returns
     -------
@@ -314,32 +405,35 @@ def preprocessing_filters(image,
 
     """
 
-    try:
-        if center is True:
-            blur = detect_motion_blur(_center_image(image), **blur_params)
-        else:
-            blur = detect_motion_blur(image, **blur_params)
-    except:
-        blur = True
-        if blur_params is not None:
+    # Checks without parameters pass. Checks that fail to run pass, with a warning.
+    blur = True
+    if blur_params is not None:
+        try:
+            if center is True:
+                blur = detect_motion_blur(_center_image(image), **blur_params)
+            else:
+                blur = detect_motion_blur(image, **blur_params)
+        except Exception:
             warn("Skipping motion blur check", UserWarning)
-        pass
 
-    try:
-        bands = calc_temperature_distance(image, **temperature_params)
-    except:
-        bands = True
-        if missing_band_params is not None:
+    bands = True
+    if temperature_params is not None:
+        try:
+            bands = calc_temperature_distance(image, **temperature_params)
+        except Exception:
             warn("Skipping temperature check", UserWarning)
-        pass
 
-    try:
-        contrast = ~exposure.is_low_contrast(filters.gaussian(image, sigma=10, multichannel=True), **low_contrast_params)
-    except:
-        contrast = True
-        if low_contrast_params is not None:
+    contrast = True
+    if low_contrast_params is not None:
+        try:
+            # sigma=10 at full size, with the same 4-sigma kernel and edge mode as `filters.gaussian`.
+            # Rescale to float so `is_low_contrast` uses the same dtype range as before.
+            sigma = 10 / scale
+            ksize = 2 * int(round(4 * sigma)) + 1
+            blurred = cv2.GaussianBlur(image, (ksize, ksize), sigma, borderType=cv2.BORDER_REPLICATE)
+            contrast = not exposure.is_low_contrast(img_as_float(blurred), **low_contrast_params)
+        except Exception:
             warn("Skipping low contrast check", UserWarning)
-        pass
 
     return(blur * bands * contrast)
 
@@ -373,36 +467,45 @@ def preprocessing_actions(image,
 
     Returns
     -------
-        1. ndarray of `image.shape` after running through functions listed.
+        1. ndarray of `image.shape` after running through functions listed. If every step is
+           skipped, this is `image` itself rather than a copy.
         2. A marker for flagging errors (if `warn=True`)
 
     """
-    out = image.copy()
+    out = image  # each step returns a new array
     warning_flag = 0
 
-    try:
-        out = correct_brightfield(out, brightfield, **brightfield_correction_params)
-    except:
-        if brightfield_correction_params is not 'skip':
-            warning_flag += 1
-            warn("Skipping brightfield correction", UserWarning)
-        pass
-
-    try:
-        out = cv2.bilateralFilter(out, -1, **smoothing_params)
-    except:
-        if smoothing_params is not 'skip':
-            warning_flag += 1
-            warn("Skipping bilateral filter", UserWarning)
-        pass
-
-    try:
-        out = register_bands(out, **registration_params)
-    except:
-        if registration_params is not 'skip':
+    # brightfield correction and smoothing are both local, so do them in one pass when possible
+    fused = False
+    if isinstance(brightfield_correction_params, dict) and isinstance(smoothing_params, dict):
+        try:
+            out = _correct_and_smooth(out, brightfield, smoothing_params, **brightfield_correction_params)
+            fused = True
+        except Exception:
+            pass  # run them separately to find what failed
+
+    # Steps marked 'skip' don't run. Steps that fail to run are skipped, with a warning.
+    if not fused:
+        if brightfield_correction_params != 'skip':
+            try:
+                out = correct_brightfield(out, brightfield, **brightfield_correction_params)
+            except Exception:
+                warning_flag += 1
+                warn("Skipping brightfield correction", UserWarning)
+
+        if smoothing_params != 'skip':
+            try:
+                out = cv2.bilateralFilter(out, -1, **smoothing_params)
+            except Exception:
+                warning_flag += 1
+                warn("Skipping bilateral filter", UserWarning)
+
+    if registration_params != 'skip':
+        try:
+            out = register_bands(out, **registration_params)
+        except Exception:
             warning_flag += 1
             warn("Skipping band registration", UserWarning)
-        pass
 
     if count_warnings == True:
         out = [out, warning_flag]
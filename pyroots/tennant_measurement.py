@@ -58,16 +58,13 @@ def tennant_on_segmented(binary_image, grid_size):
     
     binary_image = binary_image > 0
     
-    # make grid of same size
-    grid = np.zeros(binary_image.shape)
-    grid = draw_fishnet(grid,
-                        size=grid_size,
-                        grid_color=(100, 100, 100),
-                        weight=1
-                       )
-    grid = grid[:, :, 0] > 0
+    # make grid of same size, with lines where `draw_fishnet` puts them
+    start = round(grid_size/2)  # offset half a grid
+    grid = np.zeros(binary_image.shape, dtype=bool)
+    grid[start::grid_size, :] = True
+    grid[:, start::grid_size] = True
     
-    obj = grid*binary_image
+    obj = np.logical_and(grid, binary_image, out=grid)
     
     crosses = ndimage.label(obj)[1]
     
@@ -127,36 +124,12 @@ def draw_fishnet(image_in,
     
     image = img_as_ubyte(image)
     
-    dimy, dimx = image.shape[0:2]
-    
-    def _grid_coords(a, b):
-        """
-        List of points spaced b from 0:a, starting at b/2
-        """
-        new = round(b/2)  # offset half a grid
-        vals = []
-        while new < a:
-            vals.append(new)
-            new += b
-        return vals
-    
-    y_vals = _grid_coords(dimy, size)
-    x_vals = _grid_coords(dimx, size)
-    
-    for i in range(1, weight):
-        y_vals += [j + i for j in y_vals]
-        x_vals += [j + i for j in x_vals]
-    
-    grid_color = [int(i) for i in grid_color]
+    start = round(size/2)  # offset half a grid
+    grid_color = np.array([int(i) for i in grid_color], dtype=image.dtype)
    
-    for i in y_vals:
-        for j in range(3):
-            image[i, :, j] = grid_color[j]
-            
-    for i in x_vals:
-        for j in range(3):
-            image[:, i, j] = grid_color[j] 
-    
-    image = img_as_ubyte(image)
+    # every `size`th row and column, `weight` pixels wide, in one strided write each
+    for i in range(int(weight)):
+        image[start + i::size, :] = grid_color
+        image[:, start + i::size] = grid_color
             
     return(image)
@@ -162,7 +162,7 @@ def thresholding_segmentation(image,
         if verbose is True:
             print("Contrast enhanced")
     except:
-        if contrast_kernel_size is not 'skip':
+        if contrast_kernel_size != 'skip':
             warn("Skipping contrast enhancement")
         pass
 
@@ -179,11 +179,11 @@ def thresholding_segmentation(image,
                 working_image[i] = ~working_image[i]
                 
     ## Combine bands. As written, keeps all 'TRUE'
-    combined = working_image[0].copy()
+    combined = working_image[0]
     for i in range(1, nbands):
         combined = combined * working_image[i]
 
-    working_image = combined.copy()
+    working_image = combined
     if verbose is True:
         print("Thresholding complete")
 
@@ -193,7 +193,7 @@ def thresholding_segmentation(image,
         if verbose is True:
             print("Image masked")
     except:
-        if mask_args is not 'skip':
+        if mask_args != 'skip':
             warn("Skipping mask")
     pass
 
@@ -202,7 +202,7 @@ def thresholding_segmentation(image,
         if verbose is True:
             print("Smoothing and noise removal complete")
     except:
-        if noise_removal_args is not 'skip':
+        if noise_removal_args != 'skip':
             warn("Skipping noise removal")
         pass
 
@@ -211,7 +211,7 @@ def thresholding_segmentation(image,
         if verbose is True:
             print("Morphology filtering complete")
     except:
-        if morphology_filter_args is not 'skip':
+        if morphology_filter_args != 'skip':
             warn("Skipping morphology filter")
         pass
 
@@ -220,7 +220,7 @@ def thresholding_segmentation(image,
         if verbose is True:
             print("Smoothing and gap filling complete")
     except:
-        if fill_gaps_args is not 'skip':
+        if fill_gaps_args != 'skip':
             warn("Skipping gap filling and smoothing")
         pass
 
@@ -235,7 +235,7 @@ def thresholding_segmentation(image,
             print("Length:width filtering complete")
     except:
         lw_dict = skel_dict.copy()
-        if lw_filter_args is not 'skip':
+        if lw_filter_args != 'skip':
             warn("Skipping length-width filter")
         pass
 
@@ -244,12 +244,12 @@ def thresholding_segmentation(image,
         if verbose is True:
             print("Diameter filter complete")
     except:
-        if diam_filter_args is not 'skip':
+        if diam_filter_args != 'skip':
             warn("Skipping diameter filter")
         pass
 
     ## Summarize
-    if diameter_bins is None or diameter_bins is 'skip':
+    if diameter_bins is None or diameter_bins == 'skip':
         summary_df = summarize_geometry(skel_dict['geometry'], image_name)
 
     else: